@@ -20,7 +20,7 @@ Auditoria:
 Requisitos mantidos:
 - Aba "Registrar BDA" exclusiva para criação (INSERT)
 - Aba "Consulta/Editar" permite abrir BDAs existentes e editar somente se tiver permissão
-- Formulário reutilizável: formulario_bda(modo, dados=None, somente_leitura=False)
+- Formulário reutilizável: formulario_bda(modo, dados=None, somente_leitura=False, rotulo_salvar=...)
 - PDF (ReportLab) gerado a partir do banco e inclui foto anexada
 - SQLite com migração segura (não quebra banco atual)
 """
@@ -28,25 +28,23 @@ Requisitos mantidos:
 import warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 import os
-import json
+import functools
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
 from datetime import datetime, date, timedelta, time as dt_time
 import uuid
 from io import BytesIO
 import hmac
 
 import numpy as np
+import orjson
 import pandas as pd
 import streamlit as st
-import altair as alt
-from PIL import Image
 
-# PDF (ReportLab)
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import cm
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image as RLImage
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+# Pillow e ReportLab são importados sob demanda (upload e PDF):
+# o login e as demais páginas não pagam o custo desses imports.
 
 
 # ==============================
@@ -67,132 +65,273 @@ st.set_page_config(
     layout="wide",
 )
 
-alt.themes.register(
-    "jde_dark",
-    lambda: {
-        "config": {
-            "view": {"stroke": "transparent"},
-            "axis": {"labelColor": JDE_BROWN, "titleColor": JDE_BROWN, "gridColor": "#d7d1c9"},
-            "legend": {"labelColor": JDE_BROWN, "titleColor": JDE_BROWN},
-            "title": {"color": JDE_BROWN},
-        }
-    },
-)
-alt.themes.enable("jde_dark")
-
-css_template = """""".format(
-    JDE_BROWN=JDE_BROWN,
-    JDE_BROWN_MED=JDE_BROWN_MED,
-    JDE_CARAMEL=JDE_CARAMEL,
-    JDE_TERRACOTTA=JDE_TERRACOTTA,
-    JDE_TEAL=JDE_TEAL,
-    JDE_BG=JDE_BG,
-    JDE_CARD=JDE_CARD,
-    TEXT_DARK=TEXT_DARK,
-    TEXT_LIGHT=TEXT_LIGHT,
-)
-st.markdown(css_template, unsafe_allow_html=True)
+
+# Config Vega-Lite comum a todos os gráficos (antes registrada como tema do Altair).
+_VEGA_CONFIG = {
+    "view": {"stroke": "transparent"},
+    "axis": {"labelColor": JDE_BROWN, "titleColor": JDE_BROWN, "gridColor": "#d7d1c9"},
+    "legend": {"labelColor": JDE_BROWN, "titleColor": JDE_BROWN},
+    "title": {"color": JDE_BROWN},
+}
+
+
+def _spec_barras(campo_y: str, titulo_y: str, cor: str) -> dict:
+    # Spec Vega-Lite escrita à mão: evita montar/validar o gráfico via Altair a cada rerun.
+    return {
+        "mark": {"type": "bar", "color": cor},
+        "encoding": {
+            "x": {"field": "falhas", "type": "quantitative", "title": "Falhas"},
+            "y": {"field": campo_y, "type": "nominal", "sort": "-x", "title": titulo_y},
+        },
+        "height": 300,
+        "config": _VEGA_CONFIG,
+    }
+
+
+def _spec_linha_tempo() -> dict:
+    return {
+        "mark": {"type": "line", "color": JDE_TEAL},
+        "encoding": {
+            "x": {"field": "data_quebra", "type": "temporal", "title": "Data"},
+            "y": {"field": "Falhas", "type": "quantitative", "title": "Falhas/dia"},
+        },
+        "height": 220,
+        "config": _VEGA_CONFIG,
+    }
+
+
+css_template = """"""
+
+
+@st.cache_resource(show_spinner=False)
+def _css_jde() -> str:
+    return css_template.format(
+        JDE_BROWN=JDE_BROWN,
+        JDE_BROWN_MED=JDE_BROWN_MED,
+        JDE_CARAMEL=JDE_CARAMEL,
+        JDE_TERRACOTTA=JDE_TERRACOTTA,
+        JDE_TEAL=JDE_TEAL,
+        JDE_BG=JDE_BG,
+        JDE_CARD=JDE_CARD,
+        TEXT_DARK=TEXT_DARK,
+        TEXT_LIGHT=TEXT_LIGHT,
+    )
+
+
+_css = _css_jde()
+if _css:
+    st.markdown(_css, unsafe_allow_html=True)
 
 DB_PATH = "bda.db"
+DB_READ_POOL_SIZE = 4
+DB_MMAP_BYTES = 256 * 1024 * 1024
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 
 # ==============================
-# DB connection
+# DB connection (pool de leitura WAL + 1 conexão de escrita)
 # ==============================
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-conn.row_factory = sqlite3.Row
-cur = conn.cursor()
+
+# date/time vão direto para o driver e são gravados como ISO (mesmo texto do antigo str()).
+# Adapters explícitos: o adapter padrão de date é obsoleto desde o Python 3.12 e time não tem.
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(dt_time, dt_time.isoformat)
+
+def _abrir_conexao(somente_leitura: bool) -> sqlite3.Connection:
+    c = sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=256)
+    if somente_leitura:
+        c.execute("PRAGMA query_only=1")
+    else:
+        c.row_factory = sqlite3.Row
+        c.execute("PRAGMA journal_mode=WAL")
+    # Por conexão: temporários (ORDER BY/GROUP BY grandes) em memória e leitura via mmap
+    c.execute("PRAGMA synchronous=NORMAL")
+    c.execute("PRAGMA cache_size=-20000")
+    c.execute("PRAGMA temp_store=MEMORY")
+    c.execute(f"PRAGMA mmap_size={DB_MMAP_BYTES}")
+    return c
+
+
+class SQLiteReadPool:
+    """Fila de conexões somente leitura, compartilhada entre sessões/threads do Streamlit."""
+
+    def __init__(self, size: int):
+        self._fila = queue.Queue(maxsize=size)
+        for _ in range(size):
+            self._fila.put(_abrir_conexao(somente_leitura=True))
+
+    @contextmanager
+    def conexao(self):
+        c = self._fila.get()
+        try:
+            yield c
+        finally:
+            self._fila.put(c)
+
+
+@st.cache_resource(show_spinner=False)
+def _db_recursos():
+    # O writer abre primeiro: é ele quem coloca o arquivo em WAL antes dos leitores.
+    writer = _abrir_conexao(somente_leitura=False)
+    return SQLiteReadPool(DB_READ_POOL_SIZE), writer, threading.RLock()
+
+
+@contextmanager
+def get_read_conn():
+    pool, _, _ = _db_recursos()
+    with pool.conexao() as c:
+        yield c
+
+
+@contextmanager
+def get_write_conn():
+    # Uma única conexão de escrita; o lock serializa INSERT/UPDATE entre sessões.
+    _, writer, lock = _db_recursos()
+    with lock:
+        yield writer
+
+
+@contextmanager
+def bda_tx():
+    """Transação de escrita: tudo dentro do bloco sai num único commit (ou rollback).
+
+    Aninhável: `with bda_tx(): inserir_bda(...); inserir_bda(...)` grava as duas juntas.
+    """
+    with get_write_conn() as conn:
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+    _cached_query.clear()
+    _consulta_quadros.clear()
+    _csv_bytes.clear()
 
 
 # ==============================
 # Schema: tabelas e migrações
 # ==============================
 
+SCHEMA_VERSION = 1
+
+
+@st.cache_resource(show_spinner=False)
 def ensure_schema():
-    # Tabela principal
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS bda (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            equipamento TEXT,
-            secao TEXT,
-            data_quebra DATE,
-            hora_quebra TIME,
-            tempo_reparo_h REAL,
-            numero_ordem TEXT,
-            numero_bda TEXT,
-            turno TEXT,
-            centro_custo TEXT,
-            aconteceu_onde TEXT,
-            aconteceu_antes TEXT,
-            descricao_reparo TEXT,
-            modo_falha TEXT,
-            acoes_corretivas TEXT,
-            responsavel_corretiva TEXT,
-            quando_corretiva DATE,
-            plano_sap TEXT,
-            descricao_plano TEXT,
-            responsavel_plano TEXT,
-            periodicidade_dias INTEGER,
-            ultima_realizacao DATE,
-            caminho_imagem TEXT,
-            criticidade TEXT,
-            categoria TEXT,
-            classificacao TEXT,
-            causa_raiz TEXT,
-            cinco_porques TEXT,
-            componentes TEXT,
-            custo_pecas REAL,
-            custo_mo REAL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            time_bda TEXT,
-            dono_bda TEXT,
-            categoria_evento TEXT,
-            cinco_porques_grid TEXT,
-            acoes_lista TEXT,
-            ultimo_executante TEXT,
-            status_plano TEXT,
-            existe_plano TEXT,
-            principio_funcionamento TEXT,
-            causas_linhas TEXT
-        )
-        """
-    )
-    conn.commit()
-
-    # Migração segura de colunas (inclui auditoria)
-    new_cols = {
-        "time_bda": "TEXT",
-        "dono_bda": "TEXT",
-        "categoria_evento": "TEXT",
-        "cinco_porques_grid": "TEXT",
-        "acoes_lista": "TEXT",
-        "ultimo_executante": "TEXT",
-        "status_plano": "TEXT",
-        "existe_plano": "TEXT",
-        "principio_funcionamento": "TEXT",
-        "causas_linhas": "TEXT",
-        "criado_por": "TEXT",
-        "atualizado_por": "TEXT",
-        "atualizado_em": "TIMESTAMP",
-    }
-    cur.execute("PRAGMA table_info(bda)")
-    existing = {r[1] for r in cur.fetchall()}
-    for col, typ in new_cols.items():
-        if col not in existing:
-            cur.execute(f"ALTER TABLE bda ADD COLUMN {col} {typ}")
-    conn.commit()
+    # Executa uma vez por processo; os reruns do Streamlit reaproveitam o resultado.
+    # Com user_version em dia, a verificação se resume a um PRAGMA.
+    with get_write_conn() as conn:
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return True
+
+        with conn:
+            cur = conn.cursor()
+            # O sqlite3 só abre transação implícita antes de DML; sem o BEGIN cada
+            # CREATE/ALTER abaixo faria seu próprio commit (e fsync).
+            cur.execute("BEGIN")
+            # Tabela principal
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS bda (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    equipamento TEXT,
+                    secao TEXT,
+                    data_quebra DATE,
+                    hora_quebra TIME,
+                    tempo_reparo_h REAL,
+                    numero_ordem TEXT,
+                    numero_bda TEXT,
+                    turno TEXT,
+                    centro_custo TEXT,
+                    aconteceu_onde TEXT,
+                    aconteceu_antes TEXT,
+                    descricao_reparo TEXT,
+                    modo_falha TEXT,
+                    acoes_corretivas TEXT,
+                    responsavel_corretiva TEXT,
+                    quando_corretiva DATE,
+                    plano_sap TEXT,
+                    descricao_plano TEXT,
+                    responsavel_plano TEXT,
+                    periodicidade_dias INTEGER,
+                    ultima_realizacao DATE,
+                    caminho_imagem TEXT,
+                    criticidade TEXT,
+                    categoria TEXT,
+                    classificacao TEXT,
+                    causa_raiz TEXT,
+                    cinco_porques TEXT,
+                    componentes TEXT,
+                    custo_pecas REAL,
+                    custo_mo REAL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    time_bda TEXT,
+                    dono_bda TEXT,
+                    categoria_evento TEXT,
+                    cinco_porques_grid TEXT,
+                    acoes_lista TEXT,
+                    ultimo_executante TEXT,
+                    status_plano TEXT,
+                    existe_plano TEXT,
+                    principio_funcionamento TEXT,
+                    causas_linhas TEXT
+                )
+                """
+            )
+
+            # Migração segura de colunas (inclui auditoria)
+            new_cols = {
+                "time_bda": "TEXT",
+                "dono_bda": "TEXT",
+                "categoria_evento": "TEXT",
+                "cinco_porques_grid": "TEXT",
+                "acoes_lista": "TEXT",
+                "ultimo_executante": "TEXT",
+                "status_plano": "TEXT",
+                "existe_plano": "TEXT",
+                "principio_funcionamento": "TEXT",
+                "causas_linhas": "TEXT",
+                "criado_por": "TEXT",
+                "atualizado_por": "TEXT",
+                "atualizado_em": "TIMESTAMP",
+            }
+            existing = {r[0] for r in cur.execute("SELECT name FROM pragma_table_info('bda')")}
+            for col, typ in new_cols.items():
+                if col not in existing:
+                    cur.execute(f"ALTER TABLE bda ADD COLUMN {col} {typ}")
+
+            # Índices das colunas usadas nos filtros do dashboard/consulta
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_bda_data ON bda(data_quebra)")
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_bda_secao_equip ON bda(secao, equipamento)")
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_bda_numero ON bda(numero_bda)")
+
+            cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return True
+
+
+@st.cache_resource(ttl=86400, show_spinner=False)
+def atualizar_estatisticas():
+    # Estatísticas do planejador de consultas, renovadas no máximo uma vez por dia.
+    with get_write_conn() as conn:
+        conn.execute("ANALYZE bda")
+        conn.commit()
+    return True
 
 
 ensure_schema()
+atualizar_estatisticas()
 
 
 # ==============================
 # Perfis e senhas (via ENV)
 # ==============================
 
+@st.cache_resource(show_spinner=False)
 def get_role_passwords():
     """Carrega senhas dos perfis via variáveis de ambiente.
 
@@ -201,6 +340,7 @@ def get_role_passwords():
       SENHA_TECNICO=123456
 
     Obs.: não hardcodamos no arquivo para evitar risco de segurança.
+    Lidas uma vez por processo: alterar as variáveis exige reiniciar o app.
     """
     pw_conf = os.getenv("SENHA_CONFIABILIDADE", "").strip()
     pw_tec = os.getenv("SENHA_TECNICO", "").strip()
@@ -219,33 +359,127 @@ def role_permissions(role: str) -> dict:
 # Utils gerais
 # ==============================
 
+_EXT_IMAGEM = (".jpg", ".jpeg", ".png", ".webp")
+IMG_MAX_LADO = 1600  # px no maior lado; fotos de celular acima disso são reduzidas ao salvar
+
+
 def salvar_imagem(upload):
     if upload is None:
         return None
     ext = os.path.splitext(upload.name)[1].lower() or ".png"
-    name = f"bda_{uuid.uuid4().hex}{ext}"
-    dest = os.path.join(UPLOAD_DIR, name)
+    from PIL import Image, ImageOps
+
     try:
         img = Image.open(upload)
-        img.save(dest)
+        if ext in _EXT_IMAGEM and max(img.size) <= IMG_MAX_LADO:
+            # Já pequena: grava os bytes originais, sem decodificar/recodificar
+            # (Image.open só leu o cabeçalho; close() fecharia o próprio upload).
+            img = None
+        else:
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((IMG_MAX_LADO, IMG_MAX_LADO), Image.LANCZOS)
     except Exception:
+        img = None
+
+    if img is None:
+        dest = os.path.join(UPLOAD_DIR, f"bda_{uuid.uuid4().hex}{ext}")
         with open(dest, "wb") as f:
             f.write(upload.getbuffer())
+        return dest
+
+    # Reduzida uma vez no upload; formulário e PDF passam a ler o arquivo leve.
+    if img.mode in ("RGBA", "LA", "P"):
+        dest = os.path.join(UPLOAD_DIR, f"bda_{uuid.uuid4().hex}.png")
+        img.save(dest, "PNG", optimize=True)
+    else:
+        dest = os.path.join(UPLOAD_DIR, f"bda_{uuid.uuid4().hex}.jpg")
+        img.convert("RGB").save(dest, "JPEG", quality=80, optimize=True)
     return dest
 
 
-def df_from_query(sql, params=None):
-    return pd.read_sql_query(sql, conn, params=params or [])
+@st.cache_data(ttl=300, show_spinner=False)
+def _cached_query(sql: str, params_tuple: tuple, dtype_backend: str | None = None) -> pd.DataFrame:
+    kwargs = {"dtype_backend": dtype_backend} if dtype_backend else {}
+    with get_read_conn() as conn:
+        return pd.read_sql_query(sql, conn, params=list(params_tuple), **kwargs)
+
+
+# SQL fixo (filtros opcionais viram parâmetros) para reaproveitar o cache de
+# statements do sqlite3 e a chave do _cached_query.
+# Intervalo semiaberto na coluna crua (texto ISO): o SQLite usa idx_bda_data.
+# date(data_quebra) no WHERE obrigava a varrer a tabela inteira.
+_WHERE_PERIODO = (
+    " WHERE data_quebra >= ? AND data_quebra < ?"
+    " AND (? = '' OR LOWER(equipamento) LIKE ?)"
+)
+SQL_BDA_PERIODO = "SELECT * FROM bda" + _WHERE_PERIODO
+# Tabela detalhada do dashboard: mais recentes primeiro; LIMIT -1 = sem limite no SQLite.
+SQL_BDA_PERIODO_RECENTES = SQL_BDA_PERIODO + " ORDER BY data_quebra DESC LIMIT ?"
+LIMITE_TABELA = 500  # linhas enviadas ao navegador antes do "Ver todos"
+
+# Dashboard: agregações feitas no SQLite; só os totais/contagens voltam para o Python.
+SQL_DASH_KPI = "SELECT COUNT(*) AS falhas, COALESCE(SUM(tempo_reparo_h), 0) AS horas_reparo FROM bda" + _WHERE_PERIODO
+SQL_DASH_TOP_EQUIP = (
+    "SELECT equipamento, COUNT(*) AS falhas FROM bda" + _WHERE_PERIODO
+    + " GROUP BY equipamento ORDER BY falhas DESC, equipamento LIMIT 10"
+)
+SQL_DASH_POR_CATEGORIA = (
+    "SELECT categoria_evento, COUNT(*) AS falhas FROM bda" + _WHERE_PERIODO
+    + " GROUP BY categoria_evento ORDER BY falhas DESC, categoria_evento"
+)
+SQL_DASH_TIMELINE = (
+    "SELECT date(data_quebra) AS data_quebra, COUNT(*) AS Falhas FROM bda" + _WHERE_PERIODO
+    + " GROUP BY 1 HAVING date(data_quebra) IS NOT NULL ORDER BY 1"
+)
+SQL_BDA_POR_ID = "SELECT * FROM bda WHERE id = ?"
+
+
+def params_periodo(data_ini, data_fim, filtro_equip: str) -> list:
+    filtro = (filtro_equip or "").lower()
+    return [str(data_ini), str(data_fim + timedelta(days=1)), filtro, f"%{filtro}%"]
+
+
+def df_from_query(sql, params=None, dtype_backend=None):
+    # Mesma consulta (SQL + parâmetros) dentro do TTL não volta ao SQLite;
+    # bda_tx (inserir_bda/atualizar_bda) limpa o cache após o commit.
+    # dtype_backend="pyarrow" guarda os TEXT em buffers Arrow em vez de objetos Python;
+    # use só onde o frame não volta para o formulário (nulos viram pd.NA, não None).
+    return _cached_query(sql, tuple(params or []), dtype_backend)
+
+
+def _empty(v) -> bool:
+    return v is None or (isinstance(v, str) and not v.strip())
+
+
+def all_filled(payload: dict, spec: tuple) -> list:
+    # spec: tupla de (chave, rótulo) dos campos obrigatórios
+    return [f"Preencha o campo: {lbl}" for k, lbl in spec if _empty(payload.get(k))]
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_date_str(s: str) -> date | None:
+    s = s.strip()
+    if not s:
+        return None
+    try:
+        return pd.to_datetime(s, errors="coerce").date()
+    except Exception:
+        return None
 
 
-def all_filled(values: dict, labels: dict) -> list:
-    errs = []
-    for k, v in values.items():
-        if v is None:
-            errs.append(f"Preencha o campo: {labels.get(k, k)}")
-        elif isinstance(v, str) and not v.strip():
-            errs.append(f"Preencha o campo: {labels.get(k, k)}")
-    return errs
+@functools.lru_cache(maxsize=4096)
+def _parse_time_str(s: str) -> dt_time | None:
+    s = s.strip()
+    if not s:
+        return None
+    try:
+        parts = s.split(":")
+        hh = int(parts[0])
+        mm = int(parts[1]) if len(parts) > 1 else 0
+        ss = int(parts[2]) if len(parts) > 2 else 0
+        return dt_time(hour=hh, minute=mm, second=ss)
+    except Exception:
+        return None
 
 
 def _parse_date(val):
@@ -256,35 +490,20 @@ def _parse_date(val):
     if isinstance(val, datetime):
         return val.date()
     if isinstance(val, str):
-        s = val.strip()
-        if not s:
-            return None
-        try:
-            return pd.to_datetime(s, errors="coerce").date()
-        except Exception:
-            return None
+        return _parse_date_str(val)
     return None
 
 
 def _parse_time(val):
-    if val is None or (isinstance(val, float) and np.isnan(val)):
-        return datetime.now().time()
+    # Vazio/inválido cai na hora atual, que por isso fica fora do cache.
     if isinstance(val, dt_time):
         return val
     if isinstance(val, datetime):
         return val.time()
     if isinstance(val, str):
-        s = val.strip()
-        if not s:
-            return datetime.now().time()
-        try:
-            parts = s.split(":")
-            hh = int(parts[0])
-            mm = int(parts[1]) if len(parts) > 1 else 0
-            ss = int(parts[2]) if len(parts) > 2 else 0
-            return dt_time(hour=hh, minute=mm, second=ss)
-        except Exception:
-            return datetime.now().time()
+        t = _parse_time_str(val)
+        if t is not None:
+            return t
     return datetime.now().time()
 
 
@@ -293,14 +512,42 @@ def _safe_json_loads(text, default):
         return default
     if isinstance(text, (list, dict)):
         return text
-    if isinstance(text, str) and not text.strip():
+    if not isinstance(text, (str, bytes)):
         return default
     try:
-        return json.loads(text)
-    except Exception:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
         return default
 
 
+_CAMPOS_TEXTO = (
+    "equipamento",
+    "secao",
+    "numero_ordem",
+    "numero_bda",
+    "turno",
+    "time_bda",
+    "dono_bda",
+    "categoria_evento",
+    "componentes",
+    "principio_funcionamento",
+    "aconteceu_onde",
+    "aconteceu_antes",
+    "descricao_reparo",
+    "modo_falha",
+    "plano_sap",
+    "descricao_plano",
+    "ultimo_executante",
+    "status_plano",
+    "existe_plano",
+    "caminho_imagem",
+    "criado_por",
+    "atualizado_por",
+    "atualizado_em",
+)
+_CAMPOS_JSON = ("cinco_porques_grid", "acoes_lista", "causas_linhas")
+
+
 def normalizar_dados_bda(dados: dict) -> dict:
     if not dados:
         return {}
@@ -319,37 +566,10 @@ def normalizar_dados_bda(dados: dict) -> dict:
     except Exception:
         d["periodicidade_dias"] = 0
 
-    d["cinco_porques_grid"] = _safe_json_loads(d.get("cinco_porques_grid"), default=[])
-    d["acoes_lista"] = _safe_json_loads(d.get("acoes_lista"), default=[])
-    d["causas_linhas"] = _safe_json_loads(d.get("causas_linhas"), default=[])
+    for k in _CAMPOS_JSON:
+        d[k] = _safe_json_loads(d.get(k), default=[])
 
-    for k in [
-        "equipamento",
-        "secao",
-        "numero_ordem",
-        "numero_bda",
-        "turno",
-        "time_bda",
-        "dono_bda",
-        "categoria_evento",
-        "componentes",
-        "principio_funcionamento",
-        "aconteceu_onde",
-        "aconteceu_antes",
-        "descricao_reparo",
-        "modo_falha",
-        "plano_sap",
-        "descricao_plano",
-        "ultimo_executante",
-        "status_plano",
-        "existe_plano",
-        "caminho_imagem",
-        "criado_por",
-        "atualizado_por",
-        "atualizado_em",
-    ]:
-        if d.get(k) is None:
-            d[k] = ""
+    d.update({k: "" for k in _CAMPOS_TEXTO if d.get(k) is None})
 
     if d.get("existe_plano") not in ("Sim", "Não"):
         d["existe_plano"] = "Sim" if d.get("plano_sap") else "Não"
@@ -357,6 +577,38 @@ def normalizar_dados_bda(dados: dict) -> dict:
     return d
 
 
+def normalizar_dados_bda_df(df: pd.DataFrame) -> pd.DataFrame:
+    """Mesmas regras de normalizar_dados_bda, aplicadas coluna a coluna no DataFrame."""
+    df = df.copy()
+    if "data_quebra" in df:
+        # Um parse por valor (com cache): pd.to_datetime na coluna inteira adota o formato
+        # do primeiro valor e transforma em NaT as linhas gravadas em outro formato.
+        hoje = date.today()
+        df["data_quebra"] = df["data_quebra"].map(lambda v: _parse_date(v) or hoje)
+    if "hora_quebra" in df:
+        df["hora_quebra"] = df["hora_quebra"].map(_parse_time)
+    if "ultima_realizacao" in df:
+        df["ultima_realizacao"] = df["ultima_realizacao"].map(_parse_date).astype(object)
+    if "tempo_reparo_h" in df:
+        df["tempo_reparo_h"] = pd.to_numeric(df["tempo_reparo_h"], errors="coerce").fillna(0.0)
+    if "periodicidade_dias" in df:
+        df["periodicidade_dias"] = pd.to_numeric(df["periodicidade_dias"], errors="coerce").fillna(0).astype("int32")
+
+    for k in _CAMPOS_JSON:
+        if k in df:
+            df[k] = df[k].map(lambda v: _safe_json_loads(v, default=[]))
+
+    texto = [k for k in _CAMPOS_TEXTO if k in df]
+    df[texto] = df[texto].fillna("")
+
+    if "existe_plano" in df:
+        sem_valor = ~df["existe_plano"].isin(("Sim", "Não"))
+        plano = df.get("plano_sap", pd.Series("", index=df.index)).astype(bool)
+        df.loc[sem_valor, "existe_plano"] = np.where(plano[sem_valor], "Sim", "Não")
+
+    return df
+
+
 # ==============================
 # Login (2 perfis)
 # ==============================
@@ -388,17 +640,18 @@ Linux/Mac:
 
     with st.form("login_form", clear_on_submit=False):
         role = st.selectbox("Perfil", ["TECNICO", "CONFIABILIDADE"], index=0)
-        user_email = st.text_input("Seu e-mail (para auditoria)", placeholder="nome.sobrenome@empresa.com").strip().lower()
+        raw_email = st.text_input("Seu e-mail (para auditoria)", placeholder="nome.sobrenome@empresa.com")
         senha = st.text_input("Senha", type="password")
         ok = st.form_submit_button("Entrar", use_container_width=True)
 
     if ok:
-        if not user_email or "@" not in user_email:
+        if "@" not in raw_email:
             st.error("Informe um e-mail válido para auditoria.")
             return
+        user_email = raw_email.strip().lower()
 
         expected = pw_conf if role == "CONFIABILIDADE" else pw_tec
-        if not hmac.compare_digest(str(senha), str(expected)):
+        if not hmac.compare_digest(senha.encode("utf-8"), expected.encode("utf-8")):
             st.error("Senha inválida.")
             return
 
@@ -429,93 +682,70 @@ require_login()
 # Validações (regras originais)
 # ==============================
 
+REQUIRED_EVENT = (
+    ("equipamento", "Equipamento"),
+    ("secao", "Seção/Local"),
+    ("data_quebra", "Data da quebra"),
+    ("hora_quebra", "Hora da quebra"),
+    ("tempo_reparo_h", "Tempo de reparo (h)"),
+    ("numero_ordem", "Nº Ordem"),
+    ("numero_bda", "Nº BDA"),
+    ("turno", "Turno"),
+    ("time_bda", "Time da BDA"),
+    ("dono_bda", "Dono da BDA"),
+    ("categoria_evento", "Categoria"),
+    ("componentes", "Componentes"),
+    ("principio_funcionamento", "Princípio de funcionamento"),
+    ("aconteceu_onde", "O que aconteceu e onde"),
+    ("aconteceu_antes", "O que aconteceu antes"),
+    ("descricao_reparo", "Descrição do reparo"),
+    ("modo_falha", "Modo da falha"),
+)
+
+REQUIRED_PLAN = (
+    ("plano_sap", "Plano SAP"),
+    ("descricao_plano", "Descrição do plano"),
+    ("ultimo_executante", "Último executante"),
+    ("periodicidade_dias", "Periodicidade (dias)"),
+    ("ultima_realizacao", "Última realização"),
+    ("status_plano", "Status do plano"),
+)
+
+_CAMPOS_NUMERICOS_OBRIG = ("tempo_reparo_h", "periodicidade_dias")
+
+_PQ_KEYS = tuple(f"pq{j}" for j in range(1, 6))
+
+
 def validar_payload(payload: dict, whys_grid: list, causas_linhas: list, acoes_lista: list) -> list:
     erros = []
 
-    obrig_evento_vals = {
-        "equipamento": payload.get("equipamento"),
-        "secao": payload.get("secao"),
-        "data_quebra": str(payload.get("data_quebra")) if payload.get("data_quebra") else None,
-        "hora_quebra": str(payload.get("hora_quebra")) if payload.get("hora_quebra") else None,
-        "tempo_reparo_h": str(payload.get("tempo_reparo_h")),
-        "numero_ordem": payload.get("numero_ordem"),
-        "numero_bda": payload.get("numero_bda"),
-        "turno": payload.get("turno") if payload.get("turno") else None,
-        "time_bda": payload.get("time_bda"),
-        "dono_bda": payload.get("dono_bda"),
-        "categoria_evento": payload.get("categoria_evento"),
-        "componentes": payload.get("componentes"),
-        "principio_funcionamento": payload.get("principio_funcionamento"),
-        "aconteceu_onde": payload.get("aconteceu_onde"),
-        "aconteceu_antes": payload.get("aconteceu_antes"),
-        "descricao_reparo": payload.get("descricao_reparo"),
-        "modo_falha": payload.get("modo_falha"),
-    }
-    labels = {
-        "equipamento": "Equipamento",
-        "secao": "Seção/Local",
-        "data_quebra": "Data da quebra",
-        "hora_quebra": "Hora da quebra",
-        "tempo_reparo_h": "Tempo de reparo (h)",
-        "numero_ordem": "Nº Ordem",
-        "numero_bda": "Nº BDA",
-        "turno": "Turno",
-        "time_bda": "Time da BDA",
-        "dono_bda": "Dono da BDA",
-        "categoria_evento": "Categoria",
-        "componentes": "Componentes",
-        "principio_funcionamento": "Princípio de funcionamento",
-        "aconteceu_onde": "O que aconteceu e onde",
-        "aconteceu_antes": "O que aconteceu antes",
-        "descricao_reparo": "Descrição do reparo",
-        "modo_falha": "Modo da falha",
-    }
-    erros += all_filled(obrig_evento_vals, labels)
+    # Numéricos passam por str() como na validação original: 0 e None contam como preenchidos.
+    valores = {**payload, **{k: str(payload.get(k)) for k in _CAMPOS_NUMERICOS_OBRIG}}
+    erros += all_filled(valores, REQUIRED_EVENT)
 
     existe_plano = payload.get("existe_plano")
     if existe_plano == "Sim":
-        plan_vals = {
-            "plano_sap": payload.get("plano_sap"),
-            "descricao_plano": payload.get("descricao_plano"),
-            "ultimo_executante": payload.get("ultimo_executante"),
-            "periodicidade_dias": str(payload.get("periodicidade_dias")),
-            "ultima_realizacao": str(payload.get("ultima_realizacao")) if payload.get("ultima_realizacao") else None,
-            "status_plano": payload.get("status_plano"),
-        }
-        plan_labels = {
-            "plano_sap": "Plano SAP",
-            "descricao_plano": "Descrição do plano",
-            "ultimo_executante": "Último executante",
-            "periodicidade_dias": "Periodicidade (dias)",
-            "ultima_realizacao": "Última realização",
-            "status_plano": "Status do plano",
-        }
-        erros += all_filled(plan_vals, plan_labels)
-
-    linhas_validas = 0
-    for i, row in enumerate(whys_grid, start=1):
-        seq_ok = True
-        filled_count = 0
-        last_idx = 0
-        for j in range(1, 6):
-            val = (row or {}).get(f"pq{j}")
-            prev = (row or {}).get(f"pq{j-1}") if j > 1 else None
-            if val and j > 1 and not prev:
-                seq_ok = False
-            if val:
-                filled_count += 1
-                last_idx = j
-        if not seq_ok:
+        erros += all_filled(valores, REQUIRED_PLAN)
+
+    # Grade dos porquês em colunas: matriz booleana (porquê x linha) de preenchimento.
+    linhas = [row or {} for row in whys_grid]
+    filled = np.array([[bool(r.get(k)) for r in linhas] for k in _PQ_KEYS], dtype=bool)
+    filled_count = filled.sum(axis=0)
+    last_idx = np.where(filled.any(axis=0), len(_PQ_KEYS) - np.argmax(filled[::-1], axis=0), 0)
+    # Sequência quebrada = algum porquê preenchido logo após um vazio.
+    seq_ok = ~(~filled[:-1] & filled[1:]).any(axis=0)
+    linhas_validas = int((filled_count >= 4).sum())
+
+    for i in range(1, len(linhas) + 1):
+        if not seq_ok[i - 1]:
             erros.append(f"Linha {i}: preencha os porquês em sequência (não pule etapas).")
-        if filled_count >= 4:
-            linhas_validas += 1
 
         causa_info = causas_linhas[i - 1] if i - 1 < len(causas_linhas) else {}
-        if filled_count > 0 and not (causa_info or {}).get("causa"):
+        if filled_count[i - 1] > 0 and not (causa_info or {}).get("causa"):
             erros.append(f"Linha {i}: preencha a Causa vinculada ao último Por quê preenchido.")
         else:
             if i - 1 < len(causas_linhas):
-                causas_linhas[i - 1]["ultimo_por_que"] = last_idx
+                causas_linhas[i - 1]["ultimo_por_que"] = int(last_idx[i - 1])
 
     if linhas_validas < 1:
         erros.append("Preencha pelo menos uma linha com no mínimo 4 Por quês.")
@@ -541,12 +771,53 @@ def validar_payload(payload: dict, whys_grid: list, causas_linhas: list, acoes_l
 # Formulário reutilizável
 # ==============================
 
-def formulario_bda(modo: str, dados: dict | None = None, somente_leitura: bool = False) -> dict:
+# Opções fixas dos selectbox + índice valor→posição, num só lugar para leitura
+# (o script roda inteiro a cada rerun, então isto não economiza trabalho).
+_TURNO_OPTS = ("", "1", "2", "3", "ADM")
+_CAT_OPTS = ("Mecânica", "Elétrica", "Instrumentação", "Segurança", "Outros")
+_STATUS_OPTS = ("No prazo", "Fora do prazo")
+_CATEGORIAS_ACOES = ("Melhoria", "Corretiva", "Implementação de padrão", "Poka Yoke")
+_TURNO_IDX = {v: i for i, v in enumerate(_TURNO_OPTS)}
+_CAT_IDX = {v: i for i, v in enumerate(_CAT_OPTS)}
+_STATUS_IDX = {v: i for i, v in enumerate(_STATUS_OPTS)}
+_CATEGORIAS_ACOES_IDX = {v: i for i, v in enumerate(_CATEGORIAS_ACOES)}
+
+_N_LINHAS_DIAG = 5  # linhas da grade de 5 porquês
+_N_ACOES = 5
+
+
+def _arquivo_existe(caminho) -> bool:
+    return bool(caminho) and isinstance(caminho, str) and os.path.exists(caminho)
+
+
+def _linhas_fixas(lista, n: int) -> list[dict]:
+    # Sempre n dicts: o render indexa direto, sem checar tamanho/tipo a cada célula.
+    lista = lista[:n] if isinstance(lista, list) else []
+    return [x if isinstance(x, dict) else {} for x in lista] + [{} for _ in range(n - len(lista))]
+
+
+def formulario_bda(modo: str, dados: dict | None = None, somente_leitura: bool = False, rotulo_salvar: str = "Salvar") -> dict:
     if modo not in ("novo", "editar"):
         raise ValueError("modo deve ser 'novo' ou 'editar'")
 
-    dados_n = normalizar_dados_bda(dados or {}) if modo == "editar" else {}
-    key_prefix = f"{modo}_{dados_n.get('id', '')}" if modo == "editar" else "novo"
+    if modo == "editar":
+        dados = dados or {}
+        key_prefix = f"{modo}_{dados.get('id', '')}"
+        # Normalização guardada na sessão: o registro só muda ao salvar (atualizado_em).
+        # Assinatura por conteúdo, não id(dados) — o dict é recriado a cada rerun.
+        cache_key = f"_norm_{key_prefix}"
+        sig = (dados.get("id"), str(dados.get("atualizado_em")), len(dados))
+        if st.session_state.get(f"{cache_key}_sig") != sig:
+            st.session_state[cache_key] = normalizar_dados_bda(dados)
+            st.session_state[f"{cache_key}_sig"] = sig
+            # stat da foto feito junto, uma vez por registro carregado
+            st.session_state[f"{cache_key}_img"] = _arquivo_existe(st.session_state[cache_key].get("caminho_imagem"))
+        dados_n = st.session_state[cache_key]
+        imagem_existe = st.session_state[f"{cache_key}_img"]
+    else:
+        dados_n = {}
+        key_prefix = "novo"
+        imagem_existe = False
 
     equipamento_init = dados_n.get("equipamento", "")
     secao_init = dados_n.get("secao", "")
@@ -579,106 +850,106 @@ def formulario_bda(modo: str, dados: dict | None = None, somente_leitura: bool =
 
     caminho_imagem_existente = dados_n.get("caminho_imagem", "")
 
-    whys_loaded = dados_n.get("cinco_porques_grid", []) if modo == "editar" else []
-    causas_loaded = dados_n.get("causas_linhas", []) if modo == "editar" else []
-    acoes_loaded = dados_n.get("acoes_lista", []) if modo == "editar" else []
-
-    tab_evento, tab_plano, tab_diag, tab_acoes = st.tabs(["Evento", "Plano Preventivo", "Diagnóstico", "Ações"])
-
-    with tab_evento:
-        colA, colB, colC, colD = st.columns(4)
-        equipamento = colA.text_input("Equipamento *", value=equipamento_init, key=f"{key_prefix}_equipamento", disabled=somente_leitura)
-        secao = colB.text_input("Seção / Local *", value=secao_init, key=f"{key_prefix}_secao", disabled=somente_leitura)
-        data_quebra = colC.date_input("Data da quebra *", value=data_quebra_init, key=f"{key_prefix}_data_quebra", disabled=somente_leitura)
-        hora_quebra = colD.time_input("Hora da quebra *", value=hora_quebra_init, key=f"{key_prefix}_hora_quebra", disabled=somente_leitura)
-
-        col1, col2, col3, col4 = st.columns(4)
-        tempo_reparo_h = col1.number_input(
-            "Tempo de reparo (h) *",
-            min_value=0.0,
-            step=0.25,
-            value=float(tempo_reparo_init),
-            key=f"{key_prefix}_tempo_reparo_h",
-            disabled=somente_leitura,
-        )
-        numero_ordem = col2.text_input("Nº da Ordem *", value=numero_ordem_init, key=f"{key_prefix}_numero_ordem", disabled=somente_leitura)
-        numero_bda = col3.text_input("Nº BDA *", value=numero_bda_init, key=f"{key_prefix}_numero_bda", disabled=somente_leitura)
-        turno_opts = ["", "1", "2", "3", "ADM"]
-        turno_idx = turno_opts.index(turno_init) if turno_init in turno_opts else 0
-        turno = col4.selectbox("Turno *", turno_opts, index=turno_idx, key=f"{key_prefix}_turno", disabled=somente_leitura)
-
-        col5, col6, col7 = st.columns(3)
-        time_bda = col5.text_input("Time/Equipe da BDA *", value=time_bda_init, key=f"{key_prefix}_time_bda", disabled=somente_leitura)
-        dono_bda = col6.text_input("Dono da BDA *", value=dono_bda_init, key=f"{key_prefix}_dono_bda", disabled=somente_leitura)
-        cat_opts = ["Mecânica", "Elétrica", "Instrumentação", "Segurança", "Outros"]
-        cat_idx = cat_opts.index(categoria_evento_init) if categoria_evento_init in cat_opts else 0
-        categoria_evento = col7.selectbox("Categoria *", cat_opts, index=cat_idx, key=f"{key_prefix}_categoria_evento", disabled=somente_leitura)
-
-        col8, col9 = st.columns(2)
-        imagem = col8.file_uploader(
-            "Imagem da falha (foto)",
-            type=["png", "jpg", "jpeg", "webp"],
-            key=f"{key_prefix}_imagem",
-            disabled=somente_leitura,
-        )
-        if modo == "editar" and caminho_imagem_existente and os.path.exists(caminho_imagem_existente):
-            col8.caption("Imagem atual:")
-            try:
-                col8.image(caminho_imagem_existente, use_column_width=True)
-            except Exception:
-                col8.write(caminho_imagem_existente)
-
-        componentes = col9.text_area(
-            "Componentes substituídos (lista) *",
-            height=80,
-            value=componentes_init,
-            key=f"{key_prefix}_componentes",
-            disabled=somente_leitura,
-        )
+    whys_loaded = _linhas_fixas(dados_n.get("cinco_porques_grid"), _N_LINHAS_DIAG)
+    causas_loaded = _linhas_fixas(dados_n.get("causas_linhas"), _N_LINHAS_DIAG)
+    acoes_loaded = _linhas_fixas(dados_n.get("acoes_lista"), _N_ACOES)
+
+    # Tudo num st.form: digitar não dispara rerun; os valores seguem juntos no envio.
+    with st.form(f"{key_prefix}_form", clear_on_submit=False, border=False):
+        tab_evento, tab_plano, tab_diag, tab_acoes = st.tabs(["Evento", "Plano Preventivo", "Diagnóstico", "Ações"])
+
+        with tab_evento:
+            colA, colB, colC, colD = st.columns(4)
+            equipamento = colA.text_input("Equipamento *", value=equipamento_init, key=f"{key_prefix}_equipamento", disabled=somente_leitura)
+            secao = colB.text_input("Seção / Local *", value=secao_init, key=f"{key_prefix}_secao", disabled=somente_leitura)
+            data_quebra = colC.date_input("Data da quebra *", value=data_quebra_init, key=f"{key_prefix}_data_quebra", disabled=somente_leitura)
+            hora_quebra = colD.time_input("Hora da quebra *", value=hora_quebra_init, key=f"{key_prefix}_hora_quebra", disabled=somente_leitura)
+
+            col1, col2, col3, col4 = st.columns(4)
+            tempo_reparo_h = col1.number_input(
+                "Tempo de reparo (h) *",
+                min_value=0.0,
+                step=0.25,
+                value=float(tempo_reparo_init),
+                key=f"{key_prefix}_tempo_reparo_h",
+                disabled=somente_leitura,
+            )
+            numero_ordem = col2.text_input("Nº da Ordem *", value=numero_ordem_init, key=f"{key_prefix}_numero_ordem", disabled=somente_leitura)
+            numero_bda = col3.text_input("Nº BDA *", value=numero_bda_init, key=f"{key_prefix}_numero_bda", disabled=somente_leitura)
+            turno = col4.selectbox("Turno *", _TURNO_OPTS, index=_TURNO_IDX.get(turno_init, 0), key=f"{key_prefix}_turno", disabled=somente_leitura)
+
+            col5, col6, col7 = st.columns(3)
+            time_bda = col5.text_input("Time/Equipe da BDA *", value=time_bda_init, key=f"{key_prefix}_time_bda", disabled=somente_leitura)
+            dono_bda = col6.text_input("Dono da BDA *", value=dono_bda_init, key=f"{key_prefix}_dono_bda", disabled=somente_leitura)
+            categoria_evento = col7.selectbox("Categoria *", _CAT_OPTS, index=_CAT_IDX.get(categoria_evento_init, 0), key=f"{key_prefix}_categoria_evento", disabled=somente_leitura)
+
+            col8, col9 = st.columns(2)
+            imagem = col8.file_uploader(
+                "Imagem da falha (foto)",
+                type=["png", "jpg", "jpeg", "webp"],
+                key=f"{key_prefix}_imagem",
+                disabled=somente_leitura,
+            )
+            if imagem_existe:
+                col8.caption("Imagem atual:")
+                try:
+                    col8.image(caminho_imagem_existente, use_column_width=True)
+                except Exception:
+                    col8.write(caminho_imagem_existente)
+
+            componentes = col9.text_area(
+                "Componentes substituídos (lista) *",
+                height=80,
+                value=componentes_init,
+                key=f"{key_prefix}_componentes",
+                disabled=somente_leitura,
+            )
 
-        principio_funcionamento = st.text_area(
-            "Detalhamento do princípio de funcionamento do conjunto (da falha) *",
-            height=100,
-            value=principio_funcionamento_init,
-            key=f"{key_prefix}_principio_funcionamento",
-            disabled=somente_leitura,
-        )
+            principio_funcionamento = st.text_area(
+                "Detalhamento do princípio de funcionamento do conjunto (da falha) *",
+                height=100,
+                value=principio_funcionamento_init,
+                key=f"{key_prefix}_principio_funcionamento",
+                disabled=somente_leitura,
+            )
 
-        st.subheader("Descrição do Evento")
-        aconteceu_onde = st.text_area(
-            "O que aconteceu e onde? *",
-            height=100,
-            value=aconteceu_onde_init,
-            key=f"{key_prefix}_aconteceu_onde",
-            disabled=somente_leitura,
-        )
-        aconteceu_antes = st.text_area(
-            "O que aconteceu antes da quebra? *",
-            height=100,
-            value=aconteceu_antes_init,
-            key=f"{key_prefix}_aconteceu_antes",
-            disabled=somente_leitura,
-        )
-        descricao_reparo = st.text_area(
-            "Descrição da intervenção do reparo *",
-            height=100,
-            value=descricao_reparo_init,
-            key=f"{key_prefix}_descricao_reparo",
-            disabled=somente_leitura,
-        )
-        modo_falha = st.text_input("Modo da falha – frase *", value=modo_falha_init, key=f"{key_prefix}_modo_falha", disabled=somente_leitura)
-
-    with tab_plano:
-        existe_plano = st.radio(
-            "Existe plano de manutenção para esse conjunto? *",
-            ["Sim", "Não"],
-            index=0 if existe_plano_init == "Sim" else 1,
-            horizontal=True,
-            key=f"{key_prefix}_existe_plano",
-            disabled=somente_leitura,
-        )
+            st.subheader("Descrição do Evento")
+            aconteceu_onde = st.text_area(
+                "O que aconteceu e onde? *",
+                height=100,
+                value=aconteceu_onde_init,
+                key=f"{key_prefix}_aconteceu_onde",
+                disabled=somente_leitura,
+            )
+            aconteceu_antes = st.text_area(
+                "O que aconteceu antes da quebra? *",
+                height=100,
+                value=aconteceu_antes_init,
+                key=f"{key_prefix}_aconteceu_antes",
+                disabled=somente_leitura,
+            )
+            descricao_reparo = st.text_area(
+                "Descrição da intervenção do reparo *",
+                height=100,
+                value=descricao_reparo_init,
+                key=f"{key_prefix}_descricao_reparo",
+                disabled=somente_leitura,
+            )
+            modo_falha = st.text_input("Modo da falha – frase *", value=modo_falha_init, key=f"{key_prefix}_modo_falha", disabled=somente_leitura)
+
+        with tab_plano:
+            existe_plano = st.radio(
+                "Existe plano de manutenção para esse conjunto? *",
+                ["Sim", "Não"],
+                index=0 if existe_plano_init == "Sim" else 1,
+                horizontal=True,
+                key=f"{key_prefix}_existe_plano",
+                disabled=somente_leitura,
+            )
 
-        if existe_plano == "Sim":
+            # Dentro do form o radio só vale no envio: os campos ficam sempre visíveis
+            # e são descartados quando não existe plano.
+            st.caption("Se não existir plano, os campos abaixo são ignorados e uma ação de implementação de padrão é criada ao salvar.")
             colp1, colp2 = st.columns(2)
             plano_sap = colp1.text_input("Plano SAP (nº) *", value=plano_sap_init, key=f"{key_prefix}_plano_sap", disabled=somente_leitura)
             descricao_plano = colp2.text_input("Descrição do plano *", value=descricao_plano_init, key=f"{key_prefix}_descricao_plano", disabled=somente_leitura)
@@ -696,95 +967,83 @@ def formulario_bda(modo: str, dados: dict | None = None, somente_leitura: bool =
             ultima_realizacao_default = ultima_realizacao_init or date.today()
             ultima_realizacao = colp5.date_input("Última realização *", value=ultima_realizacao_default, key=f"{key_prefix}_ultima_realizacao", disabled=somente_leitura)
 
-            status_opts = ["No prazo", "Fora do prazo"]
-            status_idx = status_opts.index(status_plano_init) if status_plano_init in status_opts else 0
-            status_plano = st.selectbox("Status do plano *", status_opts, index=status_idx, key=f"{key_prefix}_status_plano", disabled=somente_leitura)
-        else:
-            plano_sap = ""
-            descricao_plano = ""
-            ultimo_executante = ""
-            periodicidade_dias = 0
-            ultima_realizacao = None
-            status_plano = ""
-            st.info(
-                "Campos do plano ocultados (Não existe plano). Uma ação de implementação de padrão será criada automaticamente ao salvar."
+            status_plano = st.selectbox("Status do plano *", _STATUS_OPTS, index=_STATUS_IDX.get(status_plano_init, 0), key=f"{key_prefix}_status_plano", disabled=somente_leitura)
+
+            if existe_plano != "Sim":
+                plano_sap = ""
+                descricao_plano = ""
+                ultimo_executante = ""
+                periodicidade_dias = 0
+                ultima_realizacao = None
+                status_plano = ""
+
+        with tab_diag:
+            st.subheader("5 Porquês / Análise detalhada")
+            ROWS, COLS = _N_LINHAS_DIAG, 5
+            whys_grid = []
+            causas_linhas = []
+
+            # Grade inteira num único st.data_editor (antes: 30 text_areas por rerun),
+            # montada coluna a coluna a partir das linhas já normalizadas.
+            colunas_pq = [f"Por quê {j}" for j in range(1, COLS + 1)]
+            colunas_ini = {colunas_pq[j - 1]: [r.get(f"pq{j}") or "" for r in whys_loaded] for j in range(1, COLS + 1)}
+            colunas_ini["Causa"] = [c.get("causa") or "" for c in causas_loaded]
+
+            df_diag = pd.DataFrame(colunas_ini, index=[f"Linha {i+1}" for i in range(ROWS)])
+            config_diag = {c: st.column_config.TextColumn(c, width="medium") for c in colunas_pq}
+            config_diag["Causa"] = st.column_config.TextColumn("Causa (ligada ao último porquê)", width="medium")
+            st.caption("Preencha os porquês da esquerda para a direita; a causa fecha a linha.")
+            editado = st.data_editor(
+                df_diag,
+                key=f"{key_prefix}_diag_grid",
+                num_rows="fixed",
+                use_container_width=True,
+                column_config=config_diag,
+                disabled=somente_leitura,
             )
 
-    with tab_diag:
-        st.subheader("5 Porquês / Análise detalhada")
-        ROWS, COLS = 5, 5
-        whys_grid = []
-        causas_linhas = []
-
-        whys_loaded = whys_loaded if isinstance(whys_loaded, list) else []
-        causas_loaded = causas_loaded if isinstance(causas_loaded, list) else []
-
-        for i in range(ROWS):
-            st.markdown(f"**Linha {i+1}**")
-            cols = st.columns(COLS + 1)
-
-            loaded_row = whys_loaded[i] if i < len(whys_loaded) and isinstance(whys_loaded[i], dict) else {}
-            loaded_causa = causas_loaded[i] if i < len(causas_loaded) and isinstance(causas_loaded[i], dict) else {}
-
-            row_dict = {}
-            last_filled_index = 0
-            for j in range(1, COLS + 1):
-                label = f"Por quê {j} ➜" if j < COLS else f"Por quê {j}"
-                init_val = loaded_row.get(f"pq{j}", "") or ""
-                val = cols[j - 1].text_area(
-                    label,
-                    key=f"{key_prefix}_why_{i}_{j}",
-                    height=80,
-                    value=init_val,
-                    placeholder="Descreva o porquê",
-                    disabled=somente_leitura,
+            for i, linha in enumerate(editado.to_dict(orient="records")):
+                row_dict = {}
+                last_filled_index = 0
+                for j in range(1, COLS + 1):
+                    val = linha.get(colunas_pq[j - 1])
+                    row_dict[f"pq{j}"] = val.strip() if isinstance(val, str) else ""
+                    if row_dict[f"pq{j}"]:
+                        last_filled_index = j
+                    if j > 1 and row_dict[f"pq{j}"] and not row_dict.get(f"pq{j-1}"):
+                        st.warning(f"Preencha o Por quê {j-1} antes do Por quê {j} na linha {i+1}.")
+
+                causa_val = linha.get("Causa")
+                whys_grid.append(row_dict)
+                causas_linhas.append(
+                    {"linha": i + 1, "causa": causa_val.strip() if isinstance(causa_val, str) else "", "ultimo_por_que": last_filled_index}
                 )
-                row_dict[f"pq{j}"] = val.strip()
-                if val.strip():
-                    last_filled_index = j
-                if j > 1 and row_dict[f"pq{j}"] and not row_dict.get(f"pq{j-1}"):
-                    st.warning(f"Preencha o Por quê {j-1} antes do Por quê {j} na linha {i+1}.")
-
-            causa_init = loaded_causa.get("causa", "") or ""
-            causa_val = cols[-1].text_area(
-                "Causa (ligada ao último porquê)",
-                key=f"{key_prefix}_causa_{i}",
-                height=80,
-                value=causa_init,
-                placeholder="Descreva a causa resultante desta linha",
-                disabled=somente_leitura,
-            )
 
-            whys_grid.append(row_dict)
-            causas_linhas.append({"linha": i + 1, "causa": causa_val.strip(), "ultimo_por_que": last_filled_index})
-            st.markdown(" ")
+        with tab_acoes:
+            st.subheader("Ações de contramedidas (mínimo 1)")
+            acoes_lista = []
 
-    with tab_acoes:
-        st.subheader("Ações de contramedidas (mínimo 1)")
-        categorias_acoes = ["Melhoria", "Corretiva", "Implementação de padrão", "Poka Yoke"]
-        acoes_lista = []
-        acoes_loaded = acoes_loaded if isinstance(acoes_loaded, list) else []
+            for i, loaded_acao in enumerate(acoes_loaded):
+                st.markdown(f"**Ação {i+1}**")
+                c1, c2, c3, c4 = st.columns([2, 1, 1, 1])
 
-        for i in range(5):
-            st.markdown(f"**Ação {i+1}**")
-            c1, c2, c3, c4 = st.columns([2, 1, 1, 1])
+                desc_init = loaded_acao.get("descricao", "") or ""
+                cat_init = loaded_acao.get("categoria", _CATEGORIAS_ACOES[0])
+                resp_init = loaded_acao.get("responsavel", "") or ""
+                prazo_init = _parse_date(loaded_acao.get("prazo")) or date.today()
 
-            loaded_acao = acoes_loaded[i] if i < len(acoes_loaded) and isinstance(acoes_loaded[i], dict) else {}
-            desc_init = loaded_acao.get("descricao", "") or ""
-            cat_init = loaded_acao.get("categoria", categorias_acoes[0])
-            resp_init = loaded_acao.get("responsavel", "") or ""
-            prazo_init = _parse_date(loaded_acao.get("prazo")) or date.today()
+                desc = c1.text_input("Ação de contramedidas", key=f"{key_prefix}_acao_desc_{i}", value=desc_init, disabled=somente_leitura)
+                cat = c2.selectbox("Categoria", _CATEGORIAS_ACOES, index=_CATEGORIAS_ACOES_IDX.get(cat_init, 0), key=f"{key_prefix}_acao_cat_{i}", disabled=somente_leitura)
+                resp = c3.text_input("Responsável", key=f"{key_prefix}_acao_resp_{i}", value=resp_init, disabled=somente_leitura)
+                prazo = c4.date_input("Prazo", value=prazo_init, key=f"{key_prefix}_acao_prazo_{i}", disabled=somente_leitura)
 
-            desc = c1.text_input("Ação de contramedidas", key=f"{key_prefix}_acao_desc_{i}", value=desc_init, disabled=somente_leitura)
-            cat_idx = categorias_acoes.index(cat_init) if cat_init in categorias_acoes else 0
-            cat = c2.selectbox("Categoria", categorias_acoes, index=cat_idx, key=f"{key_prefix}_acao_cat_{i}", disabled=somente_leitura)
-            resp = c3.text_input("Responsável", key=f"{key_prefix}_acao_resp_{i}", value=resp_init, disabled=somente_leitura)
-            prazo = c4.date_input("Prazo", value=prazo_init, key=f"{key_prefix}_acao_prazo_{i}", disabled=somente_leitura)
+                acoes_lista.append({"descricao": desc.strip(), "categoria": cat, "responsavel": resp.strip(), "prazo": str(prazo) if prazo else None})
+                st.divider()
 
-            acoes_lista.append({"descricao": desc.strip(), "categoria": cat, "responsavel": resp.strip(), "prazo": str(prazo) if prazo else None})
-            st.divider()
+            st.caption("Preencha pelo menos 1 ação.")
 
-        st.caption("Preencha pelo menos 1 ação.")
+        st.markdown("---")
+        enviado = st.form_submit_button(rotulo_salvar, use_container_width=True, disabled=somente_leitura)
 
     return {
         "equipamento": equipamento,
@@ -819,6 +1078,7 @@ def formulario_bda(modo: str, dados: dict | None = None, somente_leitura: bool =
         "_causas_linhas": causas_linhas,
         "_acoes_lista": acoes_lista,
         "_imagem_upload": imagem,
+        "_enviado": enviado,
     }
 
 
@@ -826,8 +1086,144 @@ def formulario_bda(modo: str, dados: dict | None = None, somente_leitura: bool =
 # PDF export (inclui foto + auditoria)
 # ==============================
 
+PDF_IMG_DPI = 150
+
+
+@st.cache_resource(show_spinner=False)
+def _pdf_estilos():
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+
+    # Folha de estilos criada uma vez por processo (somente leitura durante o build).
+    styles = getSampleStyleSheet()
+    styles.add(ParagraphStyle(name="H1", parent=styles["Heading1"], textColor=colors.HexColor(JDE_BROWN)))
+    styles.add(ParagraphStyle(name="H2", parent=styles["Heading2"], textColor=colors.HexColor(JDE_BROWN_MED)))
+    styles.add(ParagraphStyle(name="Body", parent=styles["BodyText"], leading=14))
+    # Células das tabelas de diagnóstico/ações, no mesmo corpo do TableStyle
+    styles.add(ParagraphStyle(name="Cell8", parent=styles["BodyText"], fontSize=8, leading=10))
+    styles.add(ParagraphStyle(name="Cell9", parent=styles["BodyText"], fontSize=9, leading=11))
+    return styles
+
+
+@st.cache_resource(show_spinner=False)
+def _pdf_table_styles():
+    from reportlab.lib import colors
+    from reportlab.platypus import TableStyle
+
+    cabecalho = [
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#efe7dc")),
+        ("GRID", (0, 0), (-1, -1), 0.25, colors.lightgrey),
+        ("VALIGN", (0, 0), (-1, -1), "TOP"),
+        ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
+    ]
+    return {
+        "evento": TableStyle(
+            [
+                ("BACKGROUND", (0, 0), (-1, 0), colors.whitesmoke),
+                ("TEXTCOLOR", (0, 0), (-1, -1), colors.black),
+                ("GRID", (0, 0), (-1, -1), 0.25, colors.lightgrey),
+                ("VALIGN", (0, 0), (-1, -1), "TOP"),
+                ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
+                ("FONTSIZE", (0, 0), (-1, -1), 9),
+                ("ROWBACKGROUNDS", (0, 0), (-1, -1), [colors.white, colors.HexColor("#f6f3ee")]),
+            ]
+        ),
+        "diag": TableStyle(cabecalho + [("FONTSIZE", (0, 0), (-1, -1), 8)]),
+        "acoes": TableStyle(cabecalho + [("FONTSIZE", (0, 0), (-1, -1), 9)]),
+    }
+
+
+def _pdf_texto(v) -> str:
+    return v if isinstance(v, str) else str(v or "")
+
+
+def _pdf_se_preenchido(v) -> str:
+    return str(v) if v else ""
+
+
+# (rótulo, chave, formatação) das tabelas Evento e Plano Preventivo do PDF
+_EVENTO_SPECS = (
+    ("Equipamento", "equipamento", _pdf_texto),
+    ("Seção/Local", "secao", _pdf_texto),
+    ("Data da quebra", "data_quebra", str),
+    ("Hora da quebra", "hora_quebra", str),
+    ("Tempo de reparo (h)", "tempo_reparo_h", str),
+    ("Nº Ordem", "numero_ordem", _pdf_texto),
+    ("Turno", "turno", _pdf_texto),
+    ("Time/Equipe", "time_bda", _pdf_texto),
+    ("Dono da BDA", "dono_bda", _pdf_texto),
+    ("Categoria", "categoria_evento", _pdf_texto),
+    ("Componentes substituídos", "componentes", _pdf_texto),
+    ("Princípio de funcionamento", "principio_funcionamento", _pdf_texto),
+    ("O que aconteceu e onde?", "aconteceu_onde", _pdf_texto),
+    ("O que aconteceu antes da quebra?", "aconteceu_antes", _pdf_texto),
+    ("Descrição do reparo", "descricao_reparo", _pdf_texto),
+    ("Modo da falha", "modo_falha", _pdf_texto),
+    ("Criado por", "criado_por", _pdf_texto),
+    ("Atualizado por", "atualizado_por", _pdf_texto),
+    ("Atualizado em", "atualizado_em", _pdf_se_preenchido),
+)
+
+_PLANO_SPECS = (
+    ("Existe plano?", "existe_plano", _pdf_texto),
+    ("Plano SAP", "plano_sap", _pdf_texto),
+    ("Descrição do plano", "descricao_plano", _pdf_texto),
+    ("Último executante", "ultimo_executante", _pdf_texto),
+    ("Periodicidade (dias)", "periodicidade_dias", str),
+    ("Última realização", "ultima_realizacao", _pdf_se_preenchido),
+    ("Status do plano", "status_plano", _pdf_texto),
+)
+
+_PDF_PADRAO = dict.fromkeys((k for _, k, _ in _EVENTO_SPECS + _PLANO_SPECS), "")
+
+
+def _imagem_pdf(caminho: str, max_w: float, max_h: float):
+    """Imagem ajustada à caixa (max_w x max_h, em pontos) e reduzida para ~PDF_IMG_DPI.
+
+    Sem a redução o ReportLab embute a foto na resolução original do celular.
+    """
+    from PIL import Image
+    from reportlab.platypus import Image as RLImage
+
+    with Image.open(caminho) as img:
+        iw, ih = img.size
+        scale = min(max_w / iw, max_h / ih)
+        draw_w, draw_h = iw * scale, ih * scale
+        alvo = (max(1, int(draw_w / 72 * PDF_IMG_DPI)), max(1, int(draw_h / 72 * PDF_IMG_DPI)))
+        if iw <= alvo[0] and ih <= alvo[1]:
+            return RLImage(caminho, width=draw_w, height=draw_h)
+        img.thumbnail(alvo)
+        buf = BytesIO()
+        if img.mode in ("RGBA", "LA", "P"):
+            img.save(buf, "PNG", optimize=True)
+        else:
+            img.convert("RGB").save(buf, "JPEG", quality=85, optimize=True)
+    buf.seek(0)
+    return RLImage(buf, width=draw_w, height=draw_h)
+
+
 def gerar_pdf_bda(dados: dict) -> bytes:
+    # Chave = conteúdo normalizado + mtime da foto: reruns e downloads repetidos
+    # da mesma BDA reaproveitam o PDF; trocar a imagem invalida a entrada.
     d = normalizar_dados_bda(dados)
+    dados_key = orjson.dumps(d, option=orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY, default=str)
+    caminho_img = d.get("caminho_imagem")
+    try:
+        # Um único stat: serve de teste de existência e de chave de invalidação.
+        img_mtime = os.path.getmtime(caminho_img) if caminho_img and isinstance(caminho_img, str) else None
+    except OSError:
+        img_mtime = None
+    return _gerar_pdf_bda_cached(dados_key, img_mtime, d)
+
+
+@st.cache_data(max_entries=64, ttl=3600, show_spinner=False)
+def _gerar_pdf_bda_cached(dados_key: bytes, img_mtime: float | None, _d: dict) -> bytes:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import cm
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table
+
+    d = {**_PDF_PADRAO, **_d}
     whys_grid = d.get("cinco_porques_grid", [])
     causas_linhas = d.get("causas_linhas", [])
     acoes_lista = d.get("acoes_lista", [])
@@ -845,84 +1241,44 @@ def gerar_pdf_bda(dados: dict) -> bytes:
         title=f"BDA {numero_bda}",
     )
 
-    styles = getSampleStyleSheet()
-    styles.add(ParagraphStyle(name="H1", parent=styles["Heading1"], textColor=colors.HexColor(JDE_BROWN)))
-    styles.add(ParagraphStyle(name="H2", parent=styles["Heading2"], textColor=colors.HexColor(JDE_BROWN_MED)))
-    styles.add(ParagraphStyle(name="Body", parent=styles["BodyText"], leading=14))
+    styles = _pdf_estilos()
 
     def p(txt):
         return Paragraph((txt or "").replace("\n", "<br/>") if isinstance(txt, str) else str(txt or ""), styles["Body"])
 
+    def cel(txt, largura, tamanho):
+        # Texto que cabe na coluna vai cru para a Table (sem parse de Paragraph);
+        # só o que precisa quebrar linha vira Paragraph. 12 pt = padding padrão da célula.
+        txt = txt if isinstance(txt, str) else str(txt or "")
+        if "\n" not in txt and stringWidth(txt, "Helvetica", tamanho) <= largura - 12:
+            return txt
+        return Paragraph(txt.replace("\n", "<br/>"), styles[f"Cell{tamanho}"])
+
     story = [Paragraph(f"BDA – {numero_bda}", styles["H1"]), Spacer(1, 0.3 * cm)]
 
     story.append(Paragraph("Evento", styles["H2"]))
-    evento_rows = [
-        ["Equipamento", d.get("equipamento", "")],
-        ["Seção/Local", d.get("secao", "")],
-        ["Data da quebra", str(d.get("data_quebra", ""))],
-        ["Hora da quebra", str(d.get("hora_quebra", ""))],
-        ["Tempo de reparo (h)", str(d.get("tempo_reparo_h", ""))],
-        ["Nº Ordem", d.get("numero_ordem", "")],
-        ["Turno", d.get("turno", "")],
-        ["Time/Equipe", d.get("time_bda", "")],
-        ["Dono da BDA", d.get("dono_bda", "")],
-        ["Categoria", d.get("categoria_evento", "")],
-        ["Componentes substituídos", d.get("componentes", "")],
-        ["Princípio de funcionamento", d.get("principio_funcionamento", "")],
-        ["O que aconteceu e onde?", d.get("aconteceu_onde", "")],
-        ["O que aconteceu antes da quebra?", d.get("aconteceu_antes", "")],
-        ["Descrição do reparo", d.get("descricao_reparo", "")],
-        ["Modo da falha", d.get("modo_falha", "")],
-        ["Criado por", d.get("criado_por", "")],
-        ["Atualizado por", d.get("atualizado_por", "")],
-        ["Atualizado em", str(d.get("atualizado_em", "")) if d.get("atualizado_em") else ""],
-    ]
+    evento_rows = [(rotulo, fmt(d[k])) for rotulo, k, fmt in _EVENTO_SPECS]
 
-    evento_style = TableStyle(
-        [
-            ("BACKGROUND", (0, 0), (-1, 0), colors.whitesmoke),
-            ("TEXTCOLOR", (0, 0), (-1, -1), colors.black),
-            ("GRID", (0, 0), (-1, -1), 0.25, colors.lightgrey),
-            ("VALIGN", (0, 0), (-1, -1), "TOP"),
-            ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
-            ("FONTSIZE", (0, 0), (-1, -1), 9),
-            ("ROWBACKGROUNDS", (0, 0), (-1, -1), [colors.white, colors.HexColor("#f6f3ee")]),
-        ]
-    )
+    tstyles = _pdf_table_styles()
 
     t = Table([[p(a), p(b)] for a, b in evento_rows], colWidths=[5 * cm, 11.5 * cm])
-    t.setStyle(evento_style)
+    t.setStyle(tstyles["evento"])
     story += [t, Spacer(1, 0.4 * cm)]
 
     caminho_img = d.get("caminho_imagem")
-    if caminho_img and isinstance(caminho_img, str) and os.path.exists(caminho_img):
+    if img_mtime is not None:
         story.append(Paragraph("Imagem da falha", styles["H2"]))
         try:
-            img = RLImage(caminho_img)
-            max_w = 16.5 * cm
-            max_h = 9.0 * cm
-            iw, ih = img.imageWidth, img.imageHeight
-            scale = min(max_w / iw, max_h / ih)
-            img.drawWidth = iw * scale
-            img.drawHeight = ih * scale
-            story.append(img)
+            story.append(_imagem_pdf(caminho_img, max_w=16.5 * cm, max_h=9.0 * cm))
             story.append(Spacer(1, 0.4 * cm))
         except Exception:
             story.append(Paragraph(f"Arquivo: {caminho_img}", styles["Body"]))
             story.append(Spacer(1, 0.4 * cm))
 
     story.append(Paragraph("Plano Preventivo", styles["H2"]))
-    plano_rows = [
-        ["Existe plano?", d.get("existe_plano", "")],
-        ["Plano SAP", d.get("plano_sap", "")],
-        ["Descrição do plano", d.get("descricao_plano", "")],
-        ["Último executante", d.get("ultimo_executante", "")],
-        ["Periodicidade (dias)", str(d.get("periodicidade_dias", ""))],
-        ["Última realização", str(d.get("ultima_realizacao", "")) if d.get("ultima_realizacao") else ""],
-        ["Status do plano", d.get("status_plano", "")],
-    ]
+    plano_rows = [(rotulo, fmt(d[k])) for rotulo, k, fmt in _PLANO_SPECS]
     t2 = Table([[p(a), p(b)] for a, b in plano_rows], colWidths=[5 * cm, 11.5 * cm])
-    t2.setStyle(evento_style)
+    t2.setStyle(tstyles["evento"])
     story += [t2, Spacer(1, 0.4 * cm)]
 
     story.append(Paragraph("Diagnóstico", styles["H2"]))
@@ -930,23 +1286,13 @@ def gerar_pdf_bda(dados: dict) -> bytes:
 
     diag_header = ["Linha", "Por quê 1", "Por quê 2", "Por quê 3", "Por quê 4", "Por quê 5", "Causa"]
     diag_rows = [diag_header]
-    for i in range(5):
-        row = whys_grid[i] if i < len(whys_grid) and isinstance(whys_grid[i], dict) else {}
-        causa = causas_linhas[i].get("causa") if i < len(causas_linhas) and isinstance(causas_linhas[i], dict) else ""
-        diag_rows.append([str(i + 1), row.get("pq1", ""), row.get("pq2", ""), row.get("pq3", ""), row.get("pq4", ""), row.get("pq5", ""), causa or ""])
-
-    t3 = Table([[p(c) for c in r] for r in diag_rows], colWidths=[1.0 * cm, 2.6 * cm, 2.6 * cm, 2.6 * cm, 2.6 * cm, 2.6 * cm, 2.7 * cm])
-    t3.setStyle(
-        TableStyle(
-            [
-                ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#efe7dc")),
-                ("GRID", (0, 0), (-1, -1), 0.25, colors.lightgrey),
-                ("VALIGN", (0, 0), (-1, -1), "TOP"),
-                ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
-                ("FONTSIZE", (0, 0), (-1, -1), 8),
-            ]
-        )
-    )
+    linhas_causa = _linhas_fixas(causas_linhas, _N_LINHAS_DIAG)
+    for i, row in enumerate(_linhas_fixas(whys_grid, _N_LINHAS_DIAG)):
+        diag_rows.append([str(i + 1), *[row.get(k, "") for k in _PQ_KEYS], linhas_causa[i].get("causa") or ""])
+
+    diag_w = [1.0 * cm, 2.6 * cm, 2.6 * cm, 2.6 * cm, 2.6 * cm, 2.6 * cm, 2.7 * cm]
+    t3 = Table([[cel(c, w, 8) for c, w in zip(r, diag_w)] for r in diag_rows], colWidths=diag_w)
+    t3.setStyle(tstyles["diag"])
     story += [t3, Spacer(1, 0.4 * cm)]
 
     story.append(Paragraph("Ações", styles["H2"]))
@@ -958,24 +1304,16 @@ def gerar_pdf_bda(dados: dict) -> bytes:
     if len(acoes_rows) == 1:
         acoes_rows.append(["-", "-", "-", "-", "-"])
 
-    t4 = Table([[p(c) for c in r] for r in acoes_rows], colWidths=[0.8 * cm, 7.5 * cm, 3.0 * cm, 3.0 * cm, 2.2 * cm])
-    t4.setStyle(
-        TableStyle(
-            [
-                ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#efe7dc")),
-                ("GRID", (0, 0), (-1, -1), 0.25, colors.lightgrey),
-                ("VALIGN", (0, 0), (-1, -1), "TOP"),
-                ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
-                ("FONTSIZE", (0, 0), (-1, -1), 9),
-            ]
-        )
-    )
+    acoes_w = [0.8 * cm, 7.5 * cm, 3.0 * cm, 3.0 * cm, 2.2 * cm]
+    t4 = Table([[cel(c, w, 9) for c, w in zip(r, acoes_w)] for r in acoes_rows], colWidths=acoes_w)
+    t4.setStyle(tstyles["acoes"])
     story.append(t4)
 
-    doc.build(story)
-    pdf_bytes = buf.getvalue()
-    buf.close()
-    return pdf_bytes
+    with buf:
+        doc.build(story)
+        # getvalue() entrega o próprio buffer interno (ajustado no lugar) quando não há
+        # views exportadas; bytes(buf.getbuffer()) é que copiaria o PDF inteiro.
+        return buf.getvalue()
 
 
 # ==============================
@@ -1029,88 +1367,186 @@ DB_COLUMNS = [
 ]
 
 
+# Colunas legadas que a consulta não exibe nem edita: ficam fora do SELECT da lista.
+_COLS_OCULTAS_LISTA = (
+    "acoes_corretivas",
+    "responsavel_corretiva",
+    "quando_corretiva",
+    "criticidade",
+    "classificacao",
+    "categoria",
+    "custo_pecas",
+    "custo_mo",
+)
+_COLS_LISTA = ["id"] + [c for c in DB_COLUMNS if c not in _COLS_OCULTAS_LISTA]
+_COLS_LISTA.insert(_COLS_LISTA.index("componentes") + 1, "created_at")
+# Ordem explícita (mais recentes primeiro): sem ORDER BY a lista seguia o plano de
+# execução (varredura de idx_bda_data) e mudava junto com ele.
+SQL_BDA_LISTA = f"SELECT {', '.join(_COLS_LISTA)} FROM bda" + _WHERE_PERIODO + " ORDER BY data_quebra DESC, id DESC"
+# Exportação CSV: todas as colunas (inclusive as legadas ocultas na tela), mesmo filtro e ordem.
+SQL_BDA_EXPORT = SQL_BDA_PERIODO + " ORDER BY data_quebra DESC, id DESC"
+
+
+_INSERT_SQL = f"INSERT INTO bda ({','.join(DB_COLUMNS)}) VALUES ({','.join(':' + c for c in DB_COLUMNS)})"
+# UPDATE só das colunas alteradas. criado_por nunca é reescrito (antes o UPDATE completo
+# gravava NULL nele); os campos de auditoria entram sempre que houver alteração.
+_COLS_UPDATE = tuple(c for c in DB_COLUMNS if c != "criado_por")
+_COLS_AUDITORIA = ("atualizado_por", "atualizado_em")
+_SET_FRAG = {c: f"{c} = :{c}" for c in _COLS_UPDATE}
+
+
+def _update_sql(colunas: tuple) -> str:
+    # Fragmentos "col = :col" prontos; a mesma combinação de colunas gera o mesmo SQL,
+    # que o cache de statements do sqlite3 (cached_statements) reaproveita.
+    return f"UPDATE bda SET {', '.join(_SET_FRAG[c] for c in colunas)} WHERE id = :id"
+
+
+def _valor_gravado(v):
+    # Como o adapter registrado grava date/time (o banco devolve o texto ISO)
+    return str(v) if isinstance(v, (date, dt_time)) else v
+
+
+def _diff_bda(atual, novo: dict) -> dict:
+    return {k: novo[k] for k in _COLS_UPDATE if k not in _COLS_AUDITORIA and atual[k] != _valor_gravado(novo[k])}
+
+
+# Campos do formulário lidos por _montar_db_payload; ausentes valem None (como o antigo .get)
+_PAYLOAD_PADRAO = dict.fromkeys(
+    (
+        "equipamento",
+        "secao",
+        "data_quebra",
+        "hora_quebra",
+        "tempo_reparo_h",
+        "numero_ordem",
+        "numero_bda",
+        "turno",
+        "aconteceu_onde",
+        "aconteceu_antes",
+        "descricao_reparo",
+        "modo_falha",
+        "plano_sap",
+        "descricao_plano",
+        "periodicidade_dias",
+        "ultima_realizacao",
+        "componentes",
+        "time_bda",
+        "dono_bda",
+        "categoria_evento",
+        "ultimo_executante",
+        "status_plano",
+        "existe_plano",
+        "principio_funcionamento",
+        "cinco_porques_grid",
+        "_whys_grid",
+        "acoes_lista",
+        "_acoes_lista",
+        "causas_linhas",
+        "_causas_linhas",
+    )
+)
+
+
+def _json_lista(payload: dict, chave: str, chave_form: str) -> str:
+    # Sem memo por conteúdo: montar a chave (hash/congelar a lista) percorre a estrutura
+    # em Python, mais caro que o próprio dumps. orjson já sai em UTF-8 sem escapes
+    # (como ensure_ascii=False); decode() porque a coluna é TEXT — bytes virariam BLOB.
+    return orjson.dumps(payload[chave_form] or payload[chave] or []).decode()
+
+
 def _montar_db_payload(payload: dict, caminho_imagem: str | None, user_tag: str, is_update: bool) -> dict:
     now_ts = datetime.now().isoformat(sep=" ", timespec="seconds")
-    db_payload = {
-        "equipamento": payload.get("equipamento"),
-        "secao": payload.get("secao"),
-        "data_quebra": str(payload.get("data_quebra")) if payload.get("data_quebra") else None,
-        "hora_quebra": str(payload.get("hora_quebra")) if payload.get("hora_quebra") else None,
-        "tempo_reparo_h": float(payload.get("tempo_reparo_h") or 0.0),
-        "numero_ordem": payload.get("numero_ordem"),
-        "numero_bda": payload.get("numero_bda"),
-        "turno": payload.get("turno"),
+    payload = {**_PAYLOAD_PADRAO, **payload}
+    # Chaves na mesma ordem/conjunto de DB_COLUMNS (usadas por _INSERT_SQL/_diff_bda)
+    return {
+        "equipamento": payload["equipamento"],
+        "secao": payload["secao"],
+        "data_quebra": payload["data_quebra"] or None,
+        "hora_quebra": payload["hora_quebra"] or None,
+        "tempo_reparo_h": float(payload["tempo_reparo_h"] or 0.0),
+        "numero_ordem": payload["numero_ordem"],
+        "numero_bda": payload["numero_bda"],
+        "turno": payload["turno"],
         "centro_custo": None,
-        "aconteceu_onde": payload.get("aconteceu_onde"),
-        "aconteceu_antes": payload.get("aconteceu_antes"),
-        "descricao_reparo": payload.get("descricao_reparo"),
-        "modo_falha": payload.get("modo_falha"),
+        "aconteceu_onde": payload["aconteceu_onde"],
+        "aconteceu_antes": payload["aconteceu_antes"],
+        "descricao_reparo": payload["descricao_reparo"],
+        "modo_falha": payload["modo_falha"],
         "acoes_corretivas": None,
         "responsavel_corretiva": None,
         "quando_corretiva": None,
-        "plano_sap": payload.get("plano_sap"),
-        "descricao_plano": payload.get("descricao_plano"),
+        "plano_sap": payload["plano_sap"],
+        "descricao_plano": payload["descricao_plano"],
         "responsavel_plano": None,
-        "periodicidade_dias": int(payload.get("periodicidade_dias") or 0),
-        "ultima_realizacao": str(payload.get("ultima_realizacao")) if payload.get("ultima_realizacao") else None,
+        "periodicidade_dias": int(payload["periodicidade_dias"] or 0),
+        "ultima_realizacao": payload["ultima_realizacao"] or None,
         "caminho_imagem": caminho_imagem,
         "criticidade": None,
         "categoria": None,
         "classificacao": None,
         "causa_raiz": None,
         "cinco_porques": None,
-        "componentes": payload.get("componentes"),
+        "componentes": payload["componentes"],
         "custo_pecas": None,
         "custo_mo": None,
-        "time_bda": payload.get("time_bda"),
-        "dono_bda": payload.get("dono_bda"),
-        "categoria_evento": payload.get("categoria_evento"),
-        "cinco_porques_grid": json.dumps(payload.get("_whys_grid") or payload.get("cinco_porques_grid") or [], ensure_ascii=False),
-        "acoes_lista": json.dumps(payload.get("_acoes_lista") or payload.get("acoes_lista") or [], ensure_ascii=False),
-        "ultimo_executante": payload.get("ultimo_executante"),
-        "status_plano": payload.get("status_plano"),
-        "existe_plano": payload.get("existe_plano"),
-        "principio_funcionamento": payload.get("principio_funcionamento"),
-        "causas_linhas": json.dumps(payload.get("_causas_linhas") or payload.get("causas_linhas") or [], ensure_ascii=False),
+        "time_bda": payload["time_bda"],
+        "dono_bda": payload["dono_bda"],
+        "categoria_evento": payload["categoria_evento"],
+        "cinco_porques_grid": _json_lista(payload, "cinco_porques_grid", "_whys_grid"),
+        "acoes_lista": _json_lista(payload, "acoes_lista", "_acoes_lista"),
+        "ultimo_executante": payload["ultimo_executante"],
+        "status_plano": payload["status_plano"],
+        "existe_plano": payload["existe_plano"],
+        "principio_funcionamento": payload["principio_funcionamento"],
+        "causas_linhas": _json_lista(payload, "causas_linhas", "_causas_linhas"),
         "criado_por": None if is_update else user_tag,
         "atualizado_por": user_tag if is_update else None,
         "atualizado_em": now_ts if is_update else None,
     }
-    return {k: db_payload.get(k) for k in DB_COLUMNS}
 
 
 def inserir_bda(payload: dict, user_tag: str) -> None:
     imagem_upload = payload.get("_imagem_upload")
     img_path = salvar_imagem(imagem_upload) if imagem_upload is not None else None
     db_payload = _montar_db_payload(payload, img_path, user_tag=user_tag, is_update=False)
-    cols = ",".join(db_payload.keys())
-    qs = ":" + ",:".join(db_payload.keys())
-    cur.execute(f"INSERT INTO bda ({cols}) VALUES ({qs})", db_payload)
-    conn.commit()
+    with bda_tx() as conn:
+        conn.execute(_INSERT_SQL, db_payload)
 
 
 def atualizar_bda(bda_id: int, payload: dict, user_tag: str, caminho_imagem_atual: str | None = None) -> None:
     imagem_upload = payload.get("_imagem_upload")
-    img_path = caminho_imagem_atual if imagem_upload is None else salvar_imagem(imagem_upload)
+    # A linha da consulta vem normalizada (NULL de texto vira ""): sem imagem continua NULL.
+    img_path = (caminho_imagem_atual or None) if imagem_upload is None else salvar_imagem(imagem_upload)
     db_payload = _montar_db_payload(payload, img_path, user_tag=user_tag, is_update=True)
-    set_clause = ", ".join([f"{k} = :{k}" for k in db_payload.keys()])
-    db_payload["id"] = int(bda_id)
-    cur.execute(f"UPDATE bda SET {set_clause} WHERE id = :id", db_payload)
-    conn.commit()
+    with bda_tx() as conn:
+        atual = conn.execute(SQL_BDA_POR_ID, (int(bda_id),)).fetchone()
+        mudou = _diff_bda(atual, db_payload) if atual is not None else {}
+        if mudou:
+            mudou.update({k: db_payload[k] for k in _COLS_AUDITORIA}, id=int(bda_id))
+            sql = _update_sql(tuple(c for c in mudou if c != "id"))
+            conn.execute(sql, mudou)
 
 
 # ==============================
 # Sidebar e navegação
 # ==============================
 
+@st.cache_resource(show_spinner=False)
+def _logo_bytes() -> bytes | None:
+    # Resolvido e lido uma vez por processo (sem stat/leitura a cada rerun).
+    for p in ("jde_logo.png", "logo.png", os.path.join("assets", "jde_logo.png")):
+        if os.path.exists(p):
+            with open(p, "rb") as f:
+                return f.read()
+    return None
+
+
 def render_sidebar():
     u = current_user()
     with st.sidebar:
-        logo_candidates = ["jde_logo.png", "logo.png", os.path.join("assets", "jde_logo.png")]
-        for p in logo_candidates:
-            if os.path.exists(p):
-                st.image(p, use_column_width=True)
-                break
+        logo = _logo_bytes()
+        if logo:
+            st.image(logo, use_column_width=True)
         else:
             st.markdown("""\n**JDE**\n\nManutenção · BDA\n""")
 
@@ -1145,10 +1581,9 @@ def pagina_registrar():
         st.stop()
 
     st.header("Registro de BDA – JDE")
-    payload = formulario_bda(modo="novo")
+    payload = formulario_bda(modo="novo", rotulo_salvar="Salvar BDA")
 
-    st.markdown("---")
-    if st.button("Salvar BDA", use_container_width=True):
+    if payload["_enviado"]:
         erros = validar_payload(payload, payload.get("_whys_grid", []), payload.get("_causas_linhas", []), payload.get("_acoes_lista", []))
         if erros:
             for e in erros:
@@ -1161,6 +1596,42 @@ def pagina_registrar():
         st.balloons()
 
 
+_COLS_DATA_CONSULTA = ("data_quebra", "ultima_realizacao", "created_at", "atualizado_em")
+
+
+@st.cache_data(ttl=300, max_entries=16, show_spinner=False)
+def _csv_bytes(params_tuple: tuple) -> bytes:
+    # Consulta própria com todas as colunas: a lista da tela omite as legadas.
+    df = df_from_query(SQL_BDA_EXPORT, params_tuple)
+    for c in _COLS_DATA_CONSULTA:
+        df[c] = pd.to_datetime(df[c], errors="coerce")
+    return df.to_csv(index=False).encode("utf-8")
+
+
+@st.cache_data(ttl=300, max_entries=16, show_spinner=False)
+def _consulta_quadros(params_tuple: tuple) -> tuple[pd.DataFrame, pd.DataFrame, dict]:
+    """(lista para exibição com datas convertidas, linhas normalizadas para o formulário, id→posição).
+
+    Conversões feitas uma vez por filtro, não a cada rerun.
+    """
+    df = df_from_query(SQL_BDA_LISTA, params_tuple)
+    # Linhas já normalizadas (datas, números, JSON) para o formulário de edição.
+    df_bda = normalizar_dados_bda_df(df)
+    for c in _COLS_DATA_CONSULTA:
+        if c in df.columns:
+            df[c] = pd.to_datetime(df[c], errors="coerce")
+    id_pos = dict(zip(df["id"].tolist(), range(len(df))))
+    return df, df_bda, id_pos
+
+
+def _ao_selecionar_bda(chave: str, ids: list):
+    # Só roda quando a seleção muda, antes do rerun: a posição se refere às linhas (ids)
+    # daquela grade. Daí em diante vale o id guardado, não a posição.
+    estado = st.session_state.get(chave)
+    linhas = estado.selection.rows if estado is not None else []
+    st.session_state["consulta_sel_id"] = ids[linhas[0]] if linhas and linhas[0] < len(ids) else None
+
+
 def pagina_consulta_editar():
     u = current_user()
     pode_editar = bool(u.get("pode_editar"))
@@ -1172,53 +1643,69 @@ def pagina_consulta_editar():
     data_fim = colf2.date_input("Até", value=date.today(), key="consulta_data_fim")
     filtro_equip = colf3.text_input("Equipamento contém", "", key="consulta_filtro_equip")
 
-    sql = "SELECT * FROM bda WHERE date(data_quebra) BETWEEN date(?) AND date(?)"
-    params = [str(data_ini), str(data_fim)]
-    if filtro_equip:
-        sql += " AND LOWER(equipamento) LIKE ?"
-        params.append(f"%{filtro_equip.lower()}%")
-
-    df = df_from_query(sql, params)
+    params = params_periodo(data_ini, data_fim, filtro_equip)
+    df, df_bda, id_pos = _consulta_quadros(tuple(params))
     st.caption(f"{len(df)} registros")
 
     if df.empty:
         st.info("Nenhum registro encontrado.")
         return
 
-    for c in ["data_quebra", "ultima_realizacao", "created_at", "atualizado_em"]:
-        if c in df.columns:
-            df[c] = pd.to_datetime(df[c], errors="coerce")
-
+    # A lista vem ordenada por data_quebra DESC: o corte mantém as BDAs mais recentes.
+    df_view = df
+    if len(df) > LIMITE_TABELA and not st.checkbox(f"Ver todos ({len(df)})", key="consulta_ver_todos"):
+        st.caption(f"Mostrando as {LIMITE_TABELA} mais recentes de {len(df)} registros.")
+        df_view = df.head(LIMITE_TABELA)
+    # Seleção nativa da tabela (uma linha): escolher um registro não reenvia a grade.
+    # Se as linhas exibidas mudam (filtro, "Ver todos", gravação), o Streamlit manteria a
+    # posição selecionada, agora em outra BDA: a grade ganha nova chave e volta a
+    # destacar a BDA escolhida, se ela ainda estiver na lista.
+    ids_vista = df_view["id"].tolist()
+    if st.session_state.get("_consulta_ids_vista") != ids_vista:
+        st.session_state["_consulta_ids_vista"] = ids_vista
+        st.session_state["_consulta_grid_n"] = st.session_state.get("_consulta_grid_n", 0) + 1
+        st.session_state["_consulta_grid_key"] = f"consulta_grid_{st.session_state['_consulta_grid_n']}"
+        if st.session_state.get("consulta_sel_id") not in ids_vista:
+            st.session_state["consulta_sel_id"] = None
+    sel_id = st.session_state.get("consulta_sel_id")
+    chave_grade = st.session_state["_consulta_grid_key"]
     st.dataframe(
-        df[[c for c in df.columns if c not in ("acoes_corretivas", "responsavel_corretiva", "quando_corretiva", "criticidade", "classificacao", "categoria", "custo_pecas", "custo_mo")]],
+        df_view,
         use_container_width=True,
         hide_index=True,
+        key=chave_grade,
+        on_select=functools.partial(_ao_selecionar_bda, chave_grade, ids_vista),
+        selection_mode="single-row",
+        selection_default={"selection": {"rows": [ids_vista.index(sel_id)]}} if sel_id is not None else None,
     )
+    selecionado = sel_id in id_pos
 
-    with st.expander("Abrir / Editar / Exportar"):
+    with st.expander("Abrir / Editar / Exportar", expanded=selecionado):
         if not pode_editar:
             st.warning("Perfil TÉCNICO: edição em modo SOMENTE LEITURA. Você pode registrar novas BDAs.")
 
-        colsel1, colsel2 = st.columns([1, 2])
-        ids = df["id"].tolist()
-        sel_id = colsel1.selectbox("Selecionar por ID", ids, key="sel_bda_id")
+        st.caption("Selecione uma linha na tabela acima (ou busque pelo Nº BDA).")
+        if not selecionado:
+            # Nada selecionado, ou a BDA escolhida saiu do filtro: abre a primeira da lista.
+            sel_id = int(df["id"].iloc[0])
 
-        bda_nums = sorted({str(x) for x in df["numero_bda"].fillna("").tolist() if str(x).strip()})
-        sel_num = colsel2.selectbox("Ou selecionar por Nº BDA", [""] + bda_nums, index=0, key="sel_bda_num")
+        nums = df["numero_bda"].dropna().astype(str)
+        bda_nums = sorted(nums[nums.str.strip() != ""].unique().tolist())
+        sel_num = st.selectbox("Ou selecionar por Nº BDA", [""] + bda_nums, index=0, key="sel_bda_num")
         if sel_num:
             row_df = df[df["numero_bda"].astype(str) == sel_num]
             if not row_df.empty:
                 sel_id = int(row_df.iloc[0]["id"])
 
-        row_db = df[df["id"] == sel_id].iloc[0].to_dict()
+        row_db = df_bda.iloc[id_pos[sel_id]].to_dict()
         st.subheader(f"BDA ID {sel_id} – Nº {row_db.get('numero_bda', '')}")
 
-        payload_edit = formulario_bda(modo="editar", dados=row_db, somente_leitura=(not pode_editar))
+        payload_edit = formulario_bda(modo="editar", dados=row_db, somente_leitura=(not pode_editar), rotulo_salvar="Salvar alterações")
 
-        cbtn1, cbtn2, cbtn3 = st.columns([1, 1, 1])
+        cbtn1, cbtn2 = st.columns([1, 1])
 
         if pode_editar:
-            if cbtn1.button("Salvar alterações", use_container_width=True, key=f"btn_save_{sel_id}"):
+            if payload_edit["_enviado"]:
                 erros = validar_payload(payload_edit, payload_edit.get("_whys_grid", []), payload_edit.get("_causas_linhas", []), payload_edit.get("_acoes_lista", []))
                 if erros:
                     for e in erros:
@@ -1229,14 +1716,11 @@ def pagina_consulta_editar():
                 atualizar_bda(sel_id, payload_edit, user_tag=user_tag, caminho_imagem_atual=row_db.get("caminho_imagem"))
                 st.success("Alterações salvas com sucesso!")
                 st.rerun()
-        else:
-            cbtn1.button("Salvar alterações", use_container_width=True, disabled=True)
 
-        if cbtn2.button("Gerar PDF", use_container_width=True, key=f"btn_pdf_{sel_id}"):
-            df_one = df_from_query("SELECT * FROM bda WHERE id = ?", [sel_id])
-            dados_pdf = df_one.iloc[0].to_dict() if not df_one.empty else row_db
-            pdf_bytes = gerar_pdf_bda(dados_pdf)
-            nome_pdf = f"bda_{(dados_pdf.get('numero_bda') or sel_id)}.pdf"
+        if cbtn1.button("Gerar PDF", use_container_width=True, key=f"btn_pdf_{sel_id}"):
+            # row_db já é a linha atual: após salvar, o st.rerun recarrega a lista.
+            pdf_bytes = gerar_pdf_bda(row_db)
+            nome_pdf = f"bda_{(row_db.get('numero_bda') or sel_id)}.pdf"
             st.download_button(
                 "Exportar PDF",
                 data=pdf_bytes,
@@ -1246,86 +1730,98 @@ def pagina_consulta_editar():
                 key=f"dl_pdf_{sel_id}",
             )
 
-        cbtn3.download_button(
+        cbtn2.download_button(
             "Exportar CSV (filtro)",
-            data=df.to_csv(index=False).encode("utf-8"),
+            data=_csv_bytes(tuple(params)),
             file_name=f"bda_{data_ini}_{data_fim}.csv",
             mime="text/csv",
             use_container_width=True,
         )
 
 
-def pagina_dashboard():
-    st.header("Dashboard de Manutenção (BDA) – JDE")
+def calcular_kpis(falhas: int, horas_reparo: float, horas_periodo: float) -> tuple[float, float, float]:
+    """(MTTR, MTBF, disponibilidade) a partir dos totais do período; NaN quando indefinido.
 
-    colf1, colf2, colf3 = st.columns([1, 1, 1])
-    data_ini = colf1.date_input("De", value=date.today() - timedelta(days=90), key="dash_data_ini")
-    data_fim = colf2.date_input("Até", value=date.today(), key="dash_data_fim")
-    filtro_equip = colf3.text_input("Equipamento contém", "", key="dash_filtro_equip")
+    MTBF aproximado: horas do período menos horas de parada (= horas de reparo), por falha.
+    """
+    if falhas <= 0:
+        return np.nan, np.nan, np.nan
+    mttr = horas_reparo / falhas
+    tempo_operacao = horas_periodo - horas_reparo
+    mtbf = tempo_operacao / falhas if tempo_operacao >= 0 else np.nan
+    disponibilidade = mtbf / (mtbf + mttr) if not np.isnan(mtbf) and (mtbf + mttr) > 0 else np.nan
+    return mttr, mtbf, disponibilidade
 
-    sql = "SELECT * FROM bda WHERE date(data_quebra) BETWEEN date(?) AND date(?)"
-    params = [str(data_ini), str(data_fim)]
-    if filtro_equip:
-        sql += " AND LOWER(equipamento) LIKE ?"
-        params.append(f"%{filtro_equip.lower()}%")
 
-    df = df_from_query(sql, params)
-    if df.empty:
-        st.info("Sem dados para o período/critério.")
-        return
+def _fmt_kpi(valor: float, fmt: str) -> str:
+    return "-" if np.isnan(valor) else fmt.format(valor)
 
-    if "tempo_reparo_h" in df:
-        df["tempo_reparo_h"] = pd.to_numeric(df["tempo_reparo_h"], errors="coerce").fillna(0.0)
-    if "data_quebra" in df:
-        df["data_quebra"] = pd.to_datetime(df["data_quebra"], errors="coerce")
 
-    falhas = len(df)
-    tempo_reparo_total = float(df["tempo_reparo_h"].sum())
-    mttr = tempo_reparo_total / falhas if falhas > 0 else np.nan
+def pagina_dashboard():
+    st.header("Dashboard de Manutenção (BDA) – JDE")
+
+    # Filtros num form: editar datas/texto não refaz consultas nem gráficos até "Aplicar".
+    with st.form("dash_filtros", border=False):
+        colf1, colf2, colf3, colf4 = st.columns([2, 2, 2, 1], vertical_alignment="bottom")
+        data_ini = colf1.date_input("De", value=date.today() - timedelta(days=90), key="dash_data_ini")
+        data_fim = colf2.date_input("Até", value=date.today(), key="dash_data_fim")
+        filtro_equip = colf3.text_input("Equipamento contém", "", key="dash_filtro_equip")
+        colf4.form_submit_button("Aplicar", use_container_width=True)
+
+    params = params_periodo(data_ini, data_fim, filtro_equip)
+    kpi = df_from_query(SQL_DASH_KPI, params).iloc[0]
+    falhas = int(kpi["falhas"])
+    if falhas == 0:
+        st.info("Sem dados para o período/critério.")
+        return
 
-    horas_periodo = ((pd.to_datetime(str(data_fim)) - pd.to_datetime(str(data_ini))).days + 1) * 24
-    tempo_parada = float(df.get("tempo_reparo_h", pd.Series(dtype=float)).sum())
-    tempo_operacao = horas_periodo - tempo_parada if horas_periodo is not None else np.nan
-    mtbf = (tempo_operacao / falhas) if falhas > 0 and tempo_operacao >= 0 else np.nan
-    disponibilidade = (mtbf / (mtbf + mttr)) if (not np.isnan(mtbf) and not np.isnan(mttr) and (mtbf + mttr) > 0) else np.nan
+    horas_periodo = ((data_fim - data_ini).days + 1) * 24
+    mttr, mtbf, disponibilidade = calcular_kpis(falhas, float(kpi["horas_reparo"]), horas_periodo)
 
-    k1, k2, k3, k4 = st.columns(4)
-    k1.metric("Falhas", f"{falhas}")
-    k2.metric("MTTR (h)", f"{mttr:.2f}" if not np.isnan(mttr) else "-")
-    k3.metric("MTBF (h)", f"{mtbf:.2f}" if not np.isnan(mtbf) else "-")
-    k4.metric("Disponibilidade", f"{(disponibilidade*100):.1f}%" if not np.isnan(disponibilidade) else "-")
+    metricas = (
+        ("Falhas", f"{falhas}"),
+        ("MTTR (h)", _fmt_kpi(mttr, "{:.2f}")),
+        ("MTBF (h)", _fmt_kpi(mtbf, "{:.2f}")),
+        ("Disponibilidade", _fmt_kpi(disponibilidade * 100, "{:.1f}%")),
+    )
+    for col, (rotulo, valor) in zip(st.columns(len(metricas)), metricas):
+        col.metric(rotulo, valor)
 
     st.markdown("---")
     colg1, colg2 = st.columns(2)
 
-    if "equipamento" in df and not df["equipamento"].isna().all():
-        top_eq = df.groupby("equipamento", dropna=False).size().reset_index(name="falhas").sort_values("falhas", ascending=False).head(10)
-        chart1 = alt.Chart(top_eq).mark_bar(color=JDE_TERRACOTTA).encode(
-            x=alt.X("falhas:Q", title="Falhas"),
-            y=alt.Y("equipamento:N", sort="-x", title="Equipamento"),
-        ).properties(height=300)
+    top_eq = df_from_query(SQL_DASH_TOP_EQUIP, params)
+    if not top_eq["equipamento"].isna().all():
         colg1.subheader("Top 10 Equipamentos por falhas")
-        colg1.altair_chart(chart1, use_container_width=True)
-
-    if "categoria_evento" in df and not df["categoria_evento"].isna().all():
-        por_cat = df.groupby("categoria_evento", dropna=False).size().reset_index(name="falhas").sort_values("falhas", ascending=False)
-        chart2 = alt.Chart(por_cat).mark_bar(color=JDE_BROWN_MED).encode(
-            x=alt.X("falhas:Q", title="Falhas"),
-            y=alt.Y("categoria_evento:N", sort="-x", title="Categoria"),
-        ).properties(height=300)
+        colg1.vega_lite_chart(top_eq, _spec_barras("equipamento", "Equipamento", JDE_TERRACOTTA), use_container_width=True)
+
+    por_cat = df_from_query(SQL_DASH_POR_CATEGORIA, params)
+    if not por_cat["categoria_evento"].isna().all():
         colg2.subheader("Falhas por categoria (evento)")
-        colg2.altair_chart(chart2, use_container_width=True)
+        colg2.vega_lite_chart(por_cat, _spec_barras("categoria_evento", "Categoria", JDE_BROWN_MED), use_container_width=True)
 
     st.subheader("Linha do tempo de falhas")
-    timeline = df.set_index("data_quebra").sort_index().assign(Falhas=1)["Falhas"].resample("D").sum().reset_index()
-    line = alt.Chart(timeline).mark_line(color=JDE_TEAL).encode(
-        x=alt.X("data_quebra:T", title="Data"),
-        y=alt.Y("Falhas:Q", title="Falhas/dia"),
-    ).properties(height=220)
-    st.altair_chart(line, use_container_width=True)
-
-    st.subheader("Tabela detalhada")
-    st.dataframe(df.sort_values("data_quebra", ascending=False), use_container_width=True, hide_index=True)
+    # Uma linha por dia com falha; os dias vazios entre o primeiro e o último viram 0.
+    por_dia = df_from_query(SQL_DASH_TIMELINE, params)
+    por_dia["data_quebra"] = pd.to_datetime(por_dia["data_quebra"])
+    timeline = por_dia.set_index("data_quebra")["Falhas"]
+    if not timeline.empty:
+        timeline = timeline.reindex(pd.date_range(timeline.index[0], timeline.index[-1], freq="D", name="data_quebra"), fill_value=0)
+    timeline = timeline.reset_index()
+    st.vega_lite_chart(timeline, _spec_linha_tempo(), use_container_width=True)
+
+    # Linhas completas só quando pedidas (KPIs e gráficos não dependem delas),
+    # limitadas às LIMITE_TABELA mais recentes até o usuário pedir todas.
+    with st.expander("Tabela detalhada", expanded=False):
+        colt1, colt2 = st.columns(2)
+        if colt1.toggle("Mostrar registros do período", key="dash_mostrar_tabela"):
+            ver_todos = colt2.checkbox("Ver todos", key="dash_ver_todos")
+            limite = -1 if ver_todos else LIMITE_TABELA
+            df = df_from_query(SQL_BDA_PERIODO_RECENTES, params + [limite], dtype_backend="pyarrow")
+            df["data_quebra"] = pd.to_datetime(df["data_quebra"], errors="coerce")
+            if not ver_todos and falhas > LIMITE_TABELA:
+                st.caption(f"Mostrando as {LIMITE_TABELA} mais recentes de {falhas}.")
+            st.dataframe(df, use_container_width=True, hide_index=True)
     st.caption("*MTBF calculado como horas do período menos horas de parada (aproximação). Pode ser refinado por equipamento.")
 
 
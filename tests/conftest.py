@@ -0,0 +1,28 @@
+import importlib.util
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+APP = Path(__file__).resolve().parent.parent / "app.py"
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    # O app.py é um script Streamlit: importado em modo "bare", cria bda.db/uploads no cwd.
+    mp = pytest.MonkeyPatch()
+    mp.chdir(tmp_path_factory.mktemp("app"))
+    spec = importlib.util.spec_from_file_location("app", APP)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    yield mod
+    mp.undo()
+
+
+@pytest.fixture
+def banco(app):
+    # Conexão crua ao mesmo arquivo do app, para semear e conferir linhas.
+    conn = sqlite3.connect(app.DB_PATH)
+    conn.row_factory = sqlite3.Row
+    yield conn
+    conn.close()
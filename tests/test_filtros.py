@@ -0,0 +1,85 @@
+import sqlite3
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Ano reservado a este módulo (ver test_gravacao): período de 01/03 a 31/03.
+INICIO, FIM = date(2031, 3, 1), date(2031, 3, 31)
+
+# Filtro antigo: date() na coluna e o resto em pandas.
+SQL_ANTIGO = "SELECT * FROM bda WHERE date(data_quebra) BETWEEN date(?) AND date(?)"
+
+LINHAS = [
+    # (data_quebra, equipamento, categoria_evento, tempo_reparo_h)
+    ("2031-02-28", "PKD1", "Elétrica", 1.0),  # véspera do início
+    ("2031-02-28 23:59:59", "PKD1", "Elétrica", 1.0),
+    ("2031-03-01", "PKD1", "Elétrica", 2.0),  # primeiro dia
+    ("2031-03-01 00:00:00", "pkd1-b", "Mecânica", 0.5),
+    ("2031-03-15T10:30:00", "Pkd2", "Mecânica", None),
+    ("2031-03-15 08:00", "ENV3", None, 3.25),
+    ("2031-03-31", None, "Elétrica", 1.0),  # último dia
+    ("2031-03-31 23:59:59", "PKD1", "Mecânica", 4.0),
+    ("2031-04-01", "PKD1", "Elétrica", 1.0),  # dia seguinte ao fim
+    ("15/03/2031", "PKD1", "Elétrica", 1.0),  # formato que o SQLite não entende
+]
+
+
+@pytest.fixture(scope="module", autouse=True)
+def semear(app):
+    with sqlite3.connect(app.DB_PATH) as conn:
+        conn.executemany(
+            "INSERT INTO bda (data_quebra, equipamento, categoria_evento, tempo_reparo_h) VALUES (?, ?, ?, ?)",
+            LINHAS,
+        )
+
+
+def _antigo(app, filtro):
+    sql, params = SQL_ANTIGO, [str(INICIO), str(FIM)]
+    if filtro:
+        sql += " AND LOWER(equipamento) LIKE ?"
+        params.append(f"%{filtro.lower()}%")
+    df = app.df_from_query(sql, params)
+    df["tempo_reparo_h"] = pd.to_numeric(df["tempo_reparo_h"], errors="coerce").fillna(0.0)
+    return df
+
+
+def _contagem(df, coluna):
+    return {(None if pd.isna(k) else k): int(v) for k, v in df.groupby(coluna, dropna=False).size().items()}
+
+
+@pytest.mark.parametrize("filtro", ["", "PKD1", "pkd", "nada"])
+def test_filtro_sql_igual_ao_filtro_antigo(app, filtro):
+    antigo = _antigo(app, filtro)
+    params = app.params_periodo(INICIO, FIM, filtro)
+
+    lista = app.df_from_query(app.SQL_BDA_LISTA, params)
+    assert sorted(lista["id"]) == sorted(antigo["id"])
+    assert lista["data_quebra"].tolist() == sorted(lista["data_quebra"], reverse=True)
+
+    kpi = app.df_from_query(app.SQL_DASH_KPI, params).iloc[0]
+    assert int(kpi["falhas"]) == len(antigo)
+    assert float(kpi["horas_reparo"]) == pytest.approx(antigo["tempo_reparo_h"].sum())
+
+    horas = ((FIM - INICIO).days + 1) * 24
+    novo = app.calcular_kpis(int(kpi["falhas"]), float(kpi["horas_reparo"]), horas)
+    falhas, reparo = len(antigo), antigo["tempo_reparo_h"].sum()
+    mttr = reparo / falhas if falhas else np.nan
+    mtbf = (horas - reparo) / falhas if falhas else np.nan
+    np.testing.assert_allclose(novo, (mttr, mtbf, mtbf / (mtbf + mttr)))
+
+    top = app.df_from_query(app.SQL_DASH_TOP_EQUIP, params)
+    assert _contagem(top.loc[top.index.repeat(top["falhas"])], "equipamento") == _contagem(antigo, "equipamento")
+    cat = app.df_from_query(app.SQL_DASH_POR_CATEGORIA, params)
+    assert _contagem(cat.loc[cat.index.repeat(cat["falhas"])], "categoria_evento") == _contagem(antigo, "categoria_evento")
+
+    por_dia = app.df_from_query(app.SQL_DASH_TIMELINE, params)
+    dias = pd.to_datetime(antigo["data_quebra"], format="mixed").dt.strftime("%Y-%m-%d")
+    assert dict(zip(por_dia["data_quebra"], por_dia["Falhas"])) == dias.value_counts().to_dict()
+
+
+def test_bordas_do_periodo(app):
+    lista = app.df_from_query(app.SQL_BDA_LISTA, app.params_periodo(INICIO, FIM, ""))
+    assert len(lista) == 6
+    assert set(lista["data_quebra"].str[:10]) == {"2031-03-01", "2031-03-15", "2031-03-31"}
@@ -0,0 +1,72 @@
+from datetime import date, time
+
+import pytest
+
+# Ano reservado a este módulo: as consultas por período não enxergam linhas de outros testes.
+INICIO, FIM = date(2030, 1, 1), date(2030, 12, 31)
+
+
+def _payload_formulario(**campos):
+    # Como o formulário entrega uma BDA nova: texto vazio é "", sem foto nem plano.
+    payload = {k: "" for k in ("secao", "numero_ordem", "turno", "aconteceu_onde", "aconteceu_antes",
+                               "descricao_reparo", "modo_falha", "componentes", "time_bda", "dono_bda",
+                               "categoria_evento", "principio_funcionamento", "plano_sap",
+                               "descricao_plano", "ultimo_executante", "status_plano")}
+    payload.update(
+        equipamento="EQ-GRAV",
+        data_quebra=date(2030, 5, 10),
+        hora_quebra=time(8, 30),
+        tempo_reparo_h=1.5,
+        numero_bda="GRAV-1",
+        existe_plano="Não",
+        periodicidade_dias=0,
+        ultima_realizacao=None,
+        _whys_grid=[{"pq1": "w1", "pq2": "", "pq3": "", "pq4": "", "pq5": ""}],
+        _causas_linhas=[{"causa": "c1"}],
+        _acoes_lista=[],
+    )
+    payload.update(campos)
+    return payload
+
+
+def _linha_edicao(app, bda_id):
+    # Mesmo caminho da página de consulta: linha normalizada da lista filtrada.
+    _, df_bda, id_pos = app._consulta_quadros(tuple(app.params_periodo(INICIO, FIM, "")))
+    return df_bda.iloc[id_pos[bda_id]].to_dict()
+
+
+def _salvar_edicao(app, row_db, **alteracoes):
+    payload = {**row_db, **alteracoes}
+    app.atualizar_bda(row_db["id"], payload, user_tag="editor@x (CONFIABILIDADE)",
+                      caminho_imagem_atual=row_db.get("caminho_imagem"))
+
+
+@pytest.fixture
+def bda_id(app, banco):
+    numero = f"GRAV-{banco.execute('SELECT COUNT(*) FROM bda').fetchone()[0]}"
+    app.inserir_bda(_payload_formulario(numero_bda=numero), user_tag="autor@x (CONFIABILIDADE)")
+    return banco.execute("SELECT id FROM bda WHERE numero_bda = ?", (numero,)).fetchone()[0]
+
+
+def _colunas_alteradas(antes, depois):
+    return {k for k in antes.keys() if antes[k] != depois[k]}
+
+
+def test_editar_um_campo_grava_so_ele_e_a_auditoria(app, banco, bda_id):
+    antes = banco.execute("SELECT * FROM bda WHERE id = ?", (bda_id,)).fetchone()
+    _salvar_edicao(app, _linha_edicao(app, bda_id), equipamento="EQ-GRAV-2")
+    depois = banco.execute("SELECT * FROM bda WHERE id = ?", (bda_id,)).fetchone()
+
+    assert _colunas_alteradas(antes, depois) == {"equipamento", "atualizado_por", "atualizado_em"}
+    assert depois["criado_por"] == "autor@x (CONFIABILIDADE)"
+    assert depois["caminho_imagem"] is None
+    assert depois["atualizado_por"] == "editor@x (CONFIABILIDADE)"
+
+
+def test_salvar_sem_alteracao_nao_grava(app, banco, bda_id):
+    antes = banco.execute("SELECT * FROM bda WHERE id = ?", (bda_id,)).fetchone()
+    _salvar_edicao(app, _linha_edicao(app, bda_id))
+    depois = banco.execute("SELECT * FROM bda WHERE id = ?", (bda_id,)).fetchone()
+
+    assert _colunas_alteradas(antes, depois) == set()
+    assert depois["atualizado_em"] is None
@@ -0,0 +1,22 @@
+import pandas as pd
+
+
+def test_normalizadores_concordam_com_formatos_mistos(app):
+    colunas = ("id", "data_quebra", "hora_quebra", "ultima_realizacao", "tempo_reparo_h", "periodicidade_dias", "existe_plano", "plano_sap")
+    # Linhas como vêm do sqlite3 (None para NULL), com datas gravadas em formatos diferentes.
+    linhas = [
+        dict(zip(colunas, v))
+        for v in (
+            (1, "2026-09-17", "08:30:00", "17/09/2026", 1.5, 30, "Sim", None),
+            (2, "2026-09-18 08:30:00", "08:30", "2026-09-01", None, None, None, "P1"),
+            (3, "17/09/2026", "8:05", None, "2", "7", "Não", None),
+            (4, None, "10:00:00", "2026-08-31 12:00:00", 0, 0, None, None),
+            (5, "", "23:59:59", "", 3, 1, None, None),
+        )
+    ]
+    df = pd.DataFrame(linhas)
+    por_linha = [app.normalizar_dados_bda(r) for r in linhas]
+    por_coluna = app.normalizar_dados_bda_df(df).to_dict("records")
+    for a, b in zip(por_linha, por_coluna):
+        for col in colunas:
+            assert a[col] == b[col], (a["id"], col, a[col], b[col])
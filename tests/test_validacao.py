@@ -0,0 +1,86 @@
+from datetime import date, time
+
+import pytest
+
+EVENTO = {
+    "equipamento": "PKD1",
+    "secao": "Envase",
+    "data_quebra": date(2031, 3, 1),
+    "hora_quebra": time(8, 30),
+    "tempo_reparo_h": 1.5,
+    "numero_ordem": "OM-1",
+    "numero_bda": "BDA-1",
+    "turno": "1",
+    "time_bda": "Time A",
+    "dono_bda": "Ana",
+    "categoria_evento": "Mecânica",
+    "componentes": "Rolamento",
+    "principio_funcionamento": "Gira",
+    "aconteceu_onde": "Linha 2",
+    "aconteceu_antes": "Setup",
+    "descricao_reparo": "Troca",
+    "modo_falha": "Desgaste",
+    "existe_plano": "Não",
+}
+PLANO = {
+    "plano_sap": "P-1",
+    "descricao_plano": "Lubrificação",
+    "ultimo_executante": "Bia",
+    "periodicidade_dias": 30,
+    "ultima_realizacao": date(2031, 2, 1),
+    "status_plano": "No prazo",
+}
+PLANO_VAZIO = dict.fromkeys(PLANO, "") | {"periodicidade_dias": 0, "ultima_realizacao": None}
+ERROS_PLANO = [
+    "Preencha o campo: Plano SAP",
+    "Preencha o campo: Descrição do plano",
+    "Preencha o campo: Último executante",
+    "Preencha o campo: Última realização",
+    "Preencha o campo: Status do plano",
+]
+SEQUENCIA = "preencha os porquês em sequência (não pule etapas)."
+SEM_CAUSA = "preencha a Causa vinculada ao último Por quê preenchido."
+MINIMO_4 = "Preencha pelo menos uma linha com no mínimo 4 Por quês."
+SEM_ACAO = "Inclua pelo menos uma ação (descrição e responsável)."
+
+LINHA_OK = {"pq1": "a", "pq2": "b", "pq3": "c", "pq4": "d", "pq5": ""}
+ACAO_OK = {"descricao": "Trocar", "responsavel": "Caio", "categoria": "Corretiva", "prazo": "2031-04-01"}
+
+
+@pytest.mark.parametrize(
+    "payload, porques, causas, acoes, esperado",
+    [
+        pytest.param({}, [LINHA_OK], [{"causa": "x"}], [], [], id="completo"),
+        pytest.param({"equipamento": "", "turno": ""}, [LINHA_OK], [{"causa": "x"}], [],
+                     ["Preencha o campo: Equipamento", "Preencha o campo: Turno"], id="obrigatorios-vazios"),
+        pytest.param({"secao": "   ", "hora_quebra": None}, [LINHA_OK], [{"causa": "x"}], [],
+                     ["Preencha o campo: Seção/Local", "Preencha o campo: Hora da quebra"], id="so-espacos-e-none"),
+        pytest.param({"tempo_reparo_h": 0}, [LINHA_OK], [{"causa": "x"}], [], [], id="reparo-zero"),
+        pytest.param({"tempo_reparo_h": None}, [LINHA_OK], [{"causa": "x"}], [], [], id="reparo-none-como-original"),
+        pytest.param({**PLANO_VAZIO}, [LINHA_OK], [{"causa": "x"}], [], [], id="plano-vazio-sem-plano"),
+        pytest.param({**PLANO_VAZIO, "existe_plano": "Sim"}, [LINHA_OK], [{"causa": "x"}], [ACAO_OK],
+                     ERROS_PLANO, id="plano-vazio-com-plano"),
+        pytest.param({**PLANO, "existe_plano": "Sim"}, [LINHA_OK], [{"causa": "x"}], [ACAO_OK], [], id="plano-completo"),
+        pytest.param({**PLANO, "existe_plano": "Sim"}, [LINHA_OK], [{"causa": "x"}], [{"descricao": "Trocar"}],
+                     [SEM_ACAO], id="acao-sem-responsavel"),
+        pytest.param({}, [{**LINHA_OK, "pq2": "", "pq5": "e"}], [{"causa": "x"}], [],
+                     [f"Linha 1: {SEQUENCIA}"], id="porque-pulado"),
+        pytest.param({}, [LINHA_OK, {"pq1": "", "pq2": "b"}], [{"causa": "x"}, {"causa": "y"}], [],
+                     [f"Linha 2: {SEQUENCIA}"], id="porque-pulado-no-inicio"),
+        pytest.param({}, [LINHA_OK, {"pq1": "a"}], [{"causa": "x"}, {}], [],
+                     [f"Linha 2: {SEM_CAUSA}"], id="linha-sem-causa"),
+        pytest.param({}, [{**LINHA_OK, "pq4": ""}, None], [{"causa": "x"}], [], [MINIMO_4], id="menos-de-4-porques"),
+    ],
+)
+def test_validar_payload(app, payload, porques, causas, acoes, esperado):
+    assert app.validar_payload({**EVENTO, **payload}, porques, causas, acoes) == esperado
+
+
+def test_validar_payload_marca_ultimo_porque_e_acao_automatica(app):
+    causas, acoes = [{"causa": "x"}, {"causa": "y"}], []
+    assert app.validar_payload(dict(EVENTO), [LINHA_OK, {**LINHA_OK, "pq5": "e"}], causas, acoes) == []
+    assert [c["ultimo_por_que"] for c in causas] == [4, 5]
+    # Sem plano: a ação de criar o plano entra sozinha, uma vez só.
+    assert [a["categoria"] for a in acoes] == ["Implementação de padrão"]
+    app.validar_payload(dict(EVENTO), [LINHA_OK], causas, acoes)
+    assert len(acoes) == 1